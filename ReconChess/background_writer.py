@@ -0,0 +1,61 @@
+#!/usr/bin/env python3
+
+"""
+File Name:      background_writer.py
+
+Description:    Python file for a file sink that writes on a background thread, so logging does not count
+                against the game clock.
+"""
+
+import queue
+import threading
+
+
+class BackgroundWriter(object):
+    """
+    File-like sink that queues writes for a background thread, which appends them to the file in batches and flushes
+    after every batch. close() returns only once everything queued before it is on disk.
+    """
+
+    def __init__(self, path, mode='w', batch_size=256):
+        """
+        :param path: str -- the file to write
+        :param mode: str -- 'w'/'a' for text or 'wb'/'ab' for bytes
+        :param batch_size: int -- most queued writes joined into one file write
+        """
+        self.file = open(path, mode)
+        self.empty = b'' if 'b' in mode else ''
+        self.batch_size = batch_size
+        self.queue = queue.Queue()
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+
+    def write(self, data):
+        self.queue.put(data)
+
+    def _run(self):
+        closing = False
+        while not closing:
+            batch = [self.queue.get()]
+            while len(batch) < self.batch_size:
+                try:
+                    batch.append(self.queue.get_nowait())
+                except queue.Empty:
+                    break
+
+            # None is queued by close() and is always the last write
+            if batch[-1] is None:
+                batch.pop()
+                closing = True
+
+            self.file.write(self.empty.join(batch))
+            self.file.flush()
+        self.file.close()
+
+    def close(self):
+        """
+        Drains the queue, closes the file and stops the background thread.
+        """
+        if self.thread.is_alive():
+            self.queue.put(None)
+            self.thread.join()
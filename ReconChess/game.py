@@ -13,6 +13,179 @@ import chess
 from datetime import datetime
 
 
+###=== Precomputed move tables ===###
+# every from/to pair as a shared chess.Move so the generator never allocates moves; chess.Move is mutable, so these
+# stay inside the game and agents only ever get copies
+_MOVES = [[chess.Move(from_square, to_square) for to_square in chess.SQUARES] for from_square in chess.SQUARES]
+
+
+def _pawn_push_moves(color, to_square):
+    from_square = to_square - 8 if color == chess.WHITE else to_square + 8
+    if not 0 <= from_square < 64:
+        return ()
+    if chess.BB_SQUARES[to_square] & chess.BB_BACKRANKS:
+        return tuple(chess.Move(from_square, to_square, promotion=piece_type)
+                     for piece_type in [chess.QUEEN, chess.ROOK, chess.BISHOP, chess.KNIGHT])
+    return (_MOVES[from_square][to_square],)
+
+
+def _pawn_capture_moves(color, from_square):
+    captures = []
+    for attacked_square in chess.scan_forward(chess.BB_PAWN_ATTACKS[color][from_square]):
+        moves = [_MOVES[from_square][attacked_square]]
+        if chess.BB_SQUARES[attacked_square] & chess.BB_BACKRANKS:
+            moves += [chess.Move(from_square, attacked_square, promotion=piece_type) for piece_type in chess.PIECE_TYPES[1:-1]]
+        captures.append((chess.BB_SQUARES[attacked_square], tuple(moves)))
+    return tuple(captures)
+
+
+# single pawn pushes indexed by [color][to_square], promotions in python-chess order
+_PAWN_PUSH_MOVES = [[_pawn_push_moves(color, square) for square in chess.SQUARES] for color in [chess.BLACK, chess.WHITE]]
+# diagonal pawn moves indexed by [color][from_square] as (to_mask, moves) pairs, promotions included
+_PAWN_CAPTURE_MOVES = [[_pawn_capture_moves(color, square) for square in chess.SQUARES] for color in [chess.BLACK, chess.WHITE]]
+
+# castling as (king_mask, rook_mask, must_be_empty_mask, move), h-side first like python-chess
+_CASTLING_MOVES = {
+    chess.WHITE: ((chess.BB_E1, chess.BB_H1, chess.BB_F1 | chess.BB_G1, _MOVES[chess.E1][chess.G1]),
+                  (chess.BB_E1, chess.BB_A1, chess.BB_B1 | chess.BB_C1 | chess.BB_D1, _MOVES[chess.E1][chess.C1])),
+    chess.BLACK: ((chess.BB_E8, chess.BB_H8, chess.BB_F8 | chess.BB_G8, _MOVES[chess.E8][chess.G8]),
+                  (chess.BB_E8, chess.BB_A8, chess.BB_B8 | chess.BB_C8 | chess.BB_D8, _MOVES[chess.E8][chess.C8])),
+}
+
+
+def generate_fog_moves(turn, ours, pawns, knights, bishops, rooks, queens, kings, promoted, castling_rights, ep_square):
+    """
+    Generates the fog-of-war move list straight from bitboards. Opponent pieces are ignored entirely, so only `ours`
+    blocks sliders and pushes, and every diagonal pawn move onto a square we do not occupy is included. The result
+    matches python-chess pseudo-legal generation on a board without opponent pieces, followed by all pawn captures.
+    :param turn: bool - True(WHITE's turn) or False(BLACK's turn)
+    :param ours: int -- occupancy bitboard of the side to move
+    :param pawns, knights, bishops, rooks, queens, kings: int -- piece bitboards (either color)
+    :param promoted: int -- bitboard of promoted pieces
+    :param castling_rights: int -- castling rights bitboard as stored on chess.Board
+    :param ep_square: chess.SQUARE -- en passant square, or None
+
+    :return: List(chess.Move)
+    """
+    moves = []
+
+    # piece moves, blocked only by our own pieces
+    for from_square in chess.scan_reversed(ours & ~pawns):
+        bb_square = chess.BB_SQUARES[from_square]
+        if bb_square & knights:
+            attacks = chess.BB_KNIGHT_ATTACKS[from_square]
+        elif bb_square & kings:
+            attacks = chess.BB_KING_ATTACKS[from_square]
+        else:
+            attacks = 0
+            if bb_square & (bishops | queens):
+                attacks = chess.BB_DIAG_ATTACKS[from_square][chess.BB_DIAG_MASKS[from_square] & ours]
+            if bb_square & (rooks | queens):
+                attacks |= (chess.BB_RANK_ATTACKS[from_square][chess.BB_RANK_MASKS[from_square] & ours] |
+                            chess.BB_FILE_ATTACKS[from_square][chess.BB_FILE_MASKS[from_square] & ours])
+        from_moves = _MOVES[from_square]
+        for to_square in chess.scan_reversed(attacks & ~ours):
+            moves.append(from_moves[to_square])
+
+    # castling, nothing can attack the king when the opponent is invisible
+    for king_mask, rook_mask, path_mask, castle in _CASTLING_MOVES[turn]:
+        if ours & kings & ~promoted & king_mask and castling_rights & rooks & ours & rook_mask and not ours & path_mask:
+            moves.append(castle)
+
+    # pawn pushes
+    our_pawns = ours & pawns
+    if turn == chess.WHITE:
+        single_moves = our_pawns << 8 & ~ours
+        double_moves = single_moves << 8 & ~ours & chess.BB_RANK_4
+        double_offset = -16
+    else:
+        single_moves = our_pawns >> 8 & ~ours
+        double_moves = single_moves >> 8 & ~ours & chess.BB_RANK_5
+        double_offset = 16
+
+    for to_square in chess.scan_reversed(single_moves):
+        moves.extend(_PAWN_PUSH_MOVES[turn][to_square])
+    for to_square in chess.scan_reversed(double_moves):
+        moves.append(_MOVES[to_square + double_offset][to_square])
+
+    # en passant
+    if ep_square and not chess.BB_SQUARES[ep_square] & ours:
+        capturers = our_pawns & chess.BB_PAWN_ATTACKS[not turn][ep_square] & chess.BB_RANKS[4 if turn else 3]
+        for from_square in chess.scan_reversed(capturers):
+            moves.append(_MOVES[from_square][ep_square])
+
+    # diagonal pawn moves, even if there is no piece to capture
+    for pawn_square in chess.scan_forward(our_pawns):
+        for to_mask, capture_moves in _PAWN_CAPTURE_MOVES[turn][pawn_square]:
+            if not to_mask & ours:
+                moves.extend(capture_moves)
+
+    return moves
+
+
+###=== Precomputed sense windows ===###
+def _sense_squares(square):
+    rank, file = chess.square_rank(square), chess.square_file(square)
+    return tuple(chess.square(file + delta_file, rank + delta_rank)
+                 for delta_rank in [1, 0, -1] for delta_file in [-1, 0, 1]
+                 if 0 <= rank + delta_rank <= 7 and 0 <= file + delta_file <= 7)
+
+
+# the 3x3 window around each square, top row first, as square tuples and as bitmasks
+SENSE_SQUARES = [_sense_squares(square) for square in chess.SQUARES]
+SENSE_MASKS = [sum(chess.BB_SQUARES[sense_square] for sense_square in sense_squares) for sense_squares in SENSE_SQUARES]
+
+_VALID_SQUARES = frozenset(chess.SQUARES)
+_PIECES = [[None] + [chess.Piece(piece_type, color) for piece_type in chess.PIECE_TYPES] for color in [chess.BLACK, chess.WHITE]]
+
+
+def sense_window(board, square):
+    """
+    Reads the 3x3 window around `square` straight from the board's bitboards.
+    :param board: chess.Board -- the board to sense
+    :param square: chess.SQUARE -- the center of the window
+
+    :return: int -- occupancy bitboard of the window
+    :return: A list of tuples, where each tuple contains a :class:`Square` in the sense, and if there
+             was a piece on the square, then the corresponding :class:`chess.Piece`, otherwise `None`.
+    """
+    occupied = SENSE_MASKS[square] & board.occupied
+    white = board.occupied_co[chess.WHITE]
+    sense_result = []
+    for sense_square in SENSE_SQUARES[square]:
+        mask = chess.BB_SQUARES[sense_square]
+        if occupied & mask:
+            sense_result.append((sense_square, _PIECES[bool(white & mask)][board.piece_type_at(sense_square)]))
+        else:
+            sense_result.append((sense_square, None))
+    return occupied, sense_result
+
+
+###=== Compact board state ===###
+def _board_state(board):
+    """
+    Returns the bitboards and scalars that make up a board, plus the size of its move stack.
+    """
+    return (board.pawns, board.knights, board.bishops, board.rooks, board.queens, board.kings,
+            board.occupied_co[chess.WHITE], board.occupied_co[chess.BLACK], board.promoted,
+            board.turn, board.castling_rights, board.ep_square, board.halfmove_clock, board.fullmove_number,
+            len(board.move_stack))
+
+
+def _restore_board_state(board, state):
+    """
+    Writes a state from _board_state back onto `board` in place. The move stack is only rewound, so moves pushed after
+    the state was taken are dropped without allocating a new board.
+    """
+    (board.pawns, board.knights, board.bishops, board.rooks, board.queens, board.kings, white, black, board.promoted,
+     board.turn, board.castling_rights, board.ep_square, board.halfmove_clock, board.fullmove_number, stack_size) = state
+    board.occupied_co[chess.WHITE] = white
+    board.occupied_co[chess.BLACK] = black
+    board.occupied = white | black
+    del board.move_stack[stack_size:]
+    del board._stack[stack_size:]
+
+
 class Game:
 
     def __init__(self, seconds_left=600):
@@ -34,6 +207,10 @@ class Game:
         self.current_turn_start_time = None
 
         self.move_result = None
+
+        # fog move list of the current ply, cached until the next handle_move/end_turn
+        self._moves = None
+        self._move_set = None
         
     def start(self):
         """
@@ -59,67 +236,43 @@ class Game:
             return self.seconds_left_by_color[self.turn]
         
     ###=== Generate Legal Moves ===###
-    def _without_opponent_pieces(self, board, turn):
-        """
-        Returns a copy of the board with the opponent's pieces removed.
-        :param board: chess.Board -- a chess board where you want opponnet's pieces to be removed
-        :param turn: bool - True(WHITE's turn) or False(BLACK's turn), the opponnet is the 'not turn'
-        
-        :return: a chess.Board object
+    def _index_moves(self):
         """
-        b = board.copy()
-        for piece_type in chess.PIECE_TYPES:
-            for sq in b.pieces(piece_type, not turn):
-                b.remove_piece_at(sq)
-        return b
-    
-    def _moves_without_opponent_pieces(self, board, turn):
+        Generates the fog move list for the current ply once and caches it as both a list and a set.
         """
-        Returns list of legal moves without regard to opponent piece locations.
-        :param board: chess.Board -- a chess board where you want opponnet's pieces to be removed
-        :param turn: bool - True(WHITE's turn) or False(BLACK's turn), the opponnet is the 'not turn'
-        
-        :return: List(chess.Move)
-        """
-        return list(self._without_opponent_pieces(board, turn).generate_pseudo_legal_moves())
-    
-    def _pawn_capture_moves_on(self, board, turn):
-        """
-        Generates all pawn captures on `board`, even if there is no piece to capture. All promotion moves are included.
-        :param board: chess.Board -- a chess board where you want opponnet's pieces to be removed
-        :param turn: bool - True(WHITE's turn) or False(BLACK's turn), the opponnet is the 'not turn'
-        
-        :return: List(chess.Move)
-        """
-        pawn_capture_moves = []
-
-        no_opponents_board = self._without_opponent_pieces(board, turn)
-
-        for pawn_square in board.pieces(chess.PAWN, turn):
-            for attacked_square in board.attacks(pawn_square):
-                # skip this square if one of our own pieces are on the square
-                if no_opponents_board.piece_at(attacked_square):
-                    continue
+        if self._moves is None:
+            board = self.truth_board
+            self._moves = generate_fog_moves(self.turn, board.occupied_co[self.turn], board.pawns, board.knights,
+                                             board.bishops, board.rooks, board.queens, board.kings, board.promoted,
+                                             board.castling_rights, board.ep_square)
+            self._move_set = set(self._moves)
 
-                pawn_capture_moves.append(chess.Move(pawn_square, attacked_square))
+    def _clear_moves(self):
+        self._moves = None
+        self._move_set = None
 
-                # add in promotion moves
-                if attacked_square in chess.SquareSet(chess.BB_BACKRANKS):
-                    for piece_type in chess.PIECE_TYPES[1:-1]:
-                        pawn_capture_moves.append(chess.Move(pawn_square, attacked_square, promotion=piece_type))
-
-        return pawn_capture_moves
-    
     def get_moves(self):
         """
         Returns list of legal moves without regard to opponent piece locations. Allows for pawns to move diagonally.
+        Every call returns new moves, so changing them does not touch the game's own.
         :return: List(chess.Move)
         """
         if self.is_finished:
             return None
-                
-        return self._moves_without_opponent_pieces(self.truth_board,self.turn) + \
-                self._pawn_capture_moves_on(self.truth_board, self.turn)
+
+        self._index_moves()
+        return [chess.Move(move.from_square, move.to_square, move.promotion) for move in self._moves]
+
+    def get_move_set(self):
+        """
+        Returns the moves of get_moves as a set for constant time legality checks.
+        :return: Set(chess.Move)
+        """
+        if self.is_finished:
+            return None
+
+        self._index_moves()
+        return self._move_set
     
     ###=== Make move and update board ===###
     def _capture_square_of_move(self, board, move):
@@ -141,9 +294,39 @@ class Game:
                 capture_square = move.to_square
         return capture_square
         
-    def _is_psuedo_legal_castle(self, board, move):
-        return board.is_castling(move) and not self._is_illegal_castle(board, move)
-    
+    def _update_view_board(self, view, color):
+        """
+        Brings a color's view board in line with the truth board after a move, in place. Only the squares where the
+        color's occupancy changed are rewritten (the from/to squares of the taken move, the rook of a castle, or the
+        captured square), and opponent pieces revealed by sensing are dropped. The result is the truth board without
+        the opponent's pieces, exactly as if it had been rebuilt from a FEN.
+        :param view: chess.Board -- white_board or black_board
+        :param color: bool - the color that owns `view`
+        """
+        truth = self.truth_board
+        ours = truth.occupied_co[color]
+
+        for square in chess.scan_reversed(view.occupied_co[not color] | (view.occupied_co[color] ^ ours)):
+            view.set_piece_at(square, truth.piece_at(square) if ours & chess.BB_SQUARES[square] else None)
+
+        backrank = chess.BB_RANK_1 if color == chess.WHITE else chess.BB_RANK_8
+        castling_rights = truth.castling_rights & truth.rooks & ours & backrank & chess.BB_CORNERS
+        if not ours & truth.kings & ~truth.promoted & backrank & chess.BB_FILE_E:
+            castling_rights = 0
+
+        # en passant only survives when the side to move owns a pawn that can take it
+        ep_square = truth.ep_square
+        if not (color == truth.turn and ep_square and not ours & chess.BB_SQUARES[ep_square] and
+                ours & truth.pawns & chess.BB_PAWN_ATTACKS[not color][ep_square] & chess.BB_RANKS[4 if color else 3]):
+            ep_square = None
+
+        view.turn = truth.turn
+        view.castling_rights = castling_rights
+        view.ep_square = ep_square
+        view.halfmove_clock = truth.halfmove_clock
+        view.fullmove_number = truth.fullmove_number
+        view.clear_stack()
+
     def _is_illegal_castle(self, board, move):
         if not board.is_castling(move):
             return False
@@ -158,46 +341,72 @@ class Game:
 
         # illegal if any pieces are between king & rook
         rook_square = chess.square(7 if board.is_kingside_castling(move) else 0, chess.square_rank(move.from_square))
-        between_squares = chess.SquareSet(chess.BB_BETWEEN[move.from_square][rook_square])
-        if any(map(lambda s: board.piece_at(s), between_squares)):
+        if chess.BB_BETWEEN[move.from_square][rook_square] & board.occupied:
             return True
 
         # its legal
         return False
     
     def _slide_move(self, board, move):
-        psuedo_legal_moves = list(board.generate_pseudo_legal_moves())
-        squares = list(chess.SquareSet(chess.BB_BETWEEN[move.from_square][move.to_square])) + [move.to_square]
-        squares = sorted(squares, key=lambda s: chess.square_distance(s, move.from_square), reverse=True)
-        for slide_square in squares:
-            revised = chess.Move(move.from_square, slide_square, move.promotion)
-            if revised in psuedo_legal_moves:
-                return revised
-        return None
+        """
+        Stops a sliding move at the first piece on its path. Sliding pieces capture that piece, pawn pushes stop in
+        front of it.
+        :param board: chess.Board -- a board of the current game
+        :param move: chess.Move -- a pawn push or a rook, bishop or queen move whose path has none of our pieces
+
+        :return: chess.Move -- the revised move
+                 None -- if the piece cannot move at all
+        """
+        from_square, to_square = move.from_square, move.to_square
+        blockers = (chess.BB_BETWEEN[from_square][to_square] | chess.BB_SQUARES[to_square]) & board.occupied
+        if not blockers:
+            return move
+
+        # squares along a ray are ordered, so the first blocker is the nearest set bit towards the moving piece
+        upwards = to_square > from_square
+        blocker = chess.lsb(blockers) if upwards else chess.msb(blockers)
+        if board.pawns & chess.BB_SQUARES[from_square]:
+            # pawns cannot capture forward
+            blocker += -8 if upwards else 8
+            return None if blocker == from_square else chess.Move(from_square, blocker)
+        return move if blocker == to_square else chess.Move(from_square, blocker)
     
     def _add_pawn_queen_promotion(self, move):
-        back_ranks = list(chess.SquareSet(chess.BB_BACKRANKS))
-        piece = self.truth_board.piece_at(move.from_square)
-        if piece is not None and piece.piece_type == chess.PAWN and move.to_square in back_ranks and move.promotion is None:
+        to_mask = chess.BB_SQUARES[move.to_square]
+        if move.promotion is None and to_mask & chess.BB_BACKRANKS and self.truth_board.pawns & chess.BB_SQUARES[move.from_square]:
             move = chess.Move(move.from_square, move.to_square, chess.QUEEN)
         return move
     
     def _revise_move(self, move):
-        # if its a legal move, don't change it at all. note that board.generate_psuedo_legal_moves() does not
-        # include psuedo legal castles
-        if move in self.truth_board.generate_pseudo_legal_moves() or self._is_psuedo_legal_castle(self.truth_board, move):
-            return move
+        """
+        Revises a move taken from get_moves against the truth board.
+        :param move: chess.Move -- a move from get_moves, with pawn promotions already filled in
+
+        :return: chess.Move -- the move that is actually taken
+                 None -- if the move is not possible
+        """
+        board = self.truth_board
 
         # note: if there are pieces in the way, we DONT capture them
-        if self._is_illegal_castle(self.truth_board, move):
+        if board.is_castling(move):
+            return None if self._is_illegal_castle(board, move) else move
+
+        # pawns only move diagonally to capture, en passant included
+        from_mask = chess.BB_SQUARES[move.from_square]
+        if board.pawns & from_mask and chess.square_file(move.from_square) != chess.square_file(move.to_square):
+            to_mask = chess.BB_SQUARES[move.to_square]
+            if to_mask & board.occupied_co[not board.turn]:
+                return move
+            if move.to_square == board.ep_square and not to_mask & board.occupied:
+                return move
             return None
 
         # if the piece is a sliding piece, slide it as far as it can go
-        piece = self.truth_board.piece_at(move.from_square)
-        if piece.piece_type in [chess.PAWN, chess.ROOK, chess.BISHOP, chess.QUEEN]:
-            move = self._slide_move(self.truth_board, move)
+        if (board.pawns | board.rooks | board.bishops | board.queens) & from_mask:
+            return self._slide_move(board, move)
 
-        return move if move in self.truth_board.generate_pseudo_legal_moves() else None
+        # knights and kings always reach squares free of our own pieces
+        return move
     
     def handle_move(self, requested_move):
         """
@@ -217,7 +426,7 @@ class Game:
             taken_move = None   #pass move
             captured_square = None #doesn't capture anything
             reason = "Ran out of time or None object passed in"
-        elif requested_move not in self.get_moves():  #checks legality of move
+        elif requested_move not in self.get_move_set():  #checks legality of move
             taken_move = None   #pass move
             captured_square = None #doesn't capture anything
             reason = "{} is an illegal move made.".format(requested_move)
@@ -229,15 +438,12 @@ class Game:
         
         # push move to appropriate boards for updates #
         self.truth_board.push(taken_move if taken_move is not None else chess.Move.null())
+        self._clear_moves()
         #if self.turn == chess.WHITE: self.white_board.push(taken_move if taken_move is not None else chess.Move.null())
         #else: self.black_board.push(taken_move if taken_move is not None else chess.Move.null())
         
-        if self.turn == chess.WHITE:
-            self.white_board.set_fen(self._without_opponent_pieces(self.truth_board, self.turn).fen())
-            self.black_board.set_fen(self._without_opponent_pieces(self.truth_board, not self.turn).fen())
-        else:
-            self.black_board.set_fen(self._without_opponent_pieces(self.truth_board, self.turn).fen())
-            self.white_board.set_fen(self._without_opponent_pieces(self.truth_board, not self.turn).fen())
+        self._update_view_board(self.white_board, chess.WHITE)
+        self._update_view_board(self.black_board, chess.BLACK)
         
         # store captured_square to notify other player
         self.move_result = captured_square
@@ -253,16 +459,10 @@ class Game:
         :return: A list of tuples, where each tuple contains a :class:`Square` in the sense, and if there
                  was a piece on the square, then the corresponding :class:`chess.Piece`, otherwise `None`.
         """
-        if square not in list(chess.SQUARES):
+        if square not in _VALID_SQUARES:
             return []
         
-        rank, file = chess.square_rank(square), chess.square_file(square)
-        sense_result = []
-        for delta_rank in [1, 0, -1]:
-            for delta_file in [-1, 0, 1]:
-                if 0 <= rank + delta_rank <= 7 and 0 <= file + delta_file <= 7:
-                    sense_square = chess.square(file + delta_file, rank + delta_rank)
-                    sense_result.append((sense_square, self.truth_board.piece_at(sense_square)))
+        _, sense_result = sense_window(self.truth_board, square)
         
         #update sense result for each respective color board
         if self.turn == chess.WHITE:
@@ -296,6 +496,7 @@ class Game:
         self.seconds_left_by_color[self.turn] -= elapsed.total_seconds()
 
         self.turn = not self.turn
+        self._clear_moves()
         self.current_turn_start_time = datetime.now()
         
     def is_over(self):
@@ -328,4 +529,31 @@ class Game:
         if self.truth_board.king(chess.WHITE) is None:
             return chess.BLACK, "BLACK won by king capture."
         elif self.truth_board.king(chess.BLACK) is None:
-            return chess.WHITE, "WHITE won by king capture."
\ No newline at end of file
+            return chess.WHITE, "WHITE won by king capture."
+
+    ###=== Snapshot and restore ===###
+    def snapshot(self):
+        """
+        Captures the game in a compact tuple of bitboards and scalars. Agents can roll out hypothetical
+        handle_sense/handle_move/end_turn steps under the real fog rules and call restore() to undo them.
+
+        :return: tuple -- the game state, to be passed to restore()
+        """
+        return (_board_state(self.truth_board), _board_state(self.white_board), _board_state(self.black_board),
+                self.turn, self.move_result, self.is_finished, self.seconds_left_by_color[chess.WHITE],
+                self.seconds_left_by_color[chess.BLACK], self.current_turn_start_time, self._moves, self._move_set)
+
+    def restore(self, state):
+        """
+        Returns the game, in place, to a state taken with snapshot(). No boards are allocated.
+
+        :param state: tuple -- a state returned by snapshot() on this game
+        """
+        truth_state, white_state, black_state, self.turn, self.move_result, self.is_finished, white_seconds, \
+            black_seconds, self.current_turn_start_time, self._moves, self._move_set = state
+
+        _restore_board_state(self.truth_board, truth_state)
+        _restore_board_state(self.white_board, white_state)
+        _restore_board_state(self.black_board, black_state)
+        self.seconds_left_by_color[chess.WHITE] = white_seconds
+        self.seconds_left_by_color[chess.BLACK] = black_seconds
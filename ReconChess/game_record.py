@@ -0,0 +1,199 @@
+#!/usr/bin/env python3
+
+"""
+File Name:      game_record.py
+
+Description:    Python file for the compact binary game record and its replay tool.
+                A record is an append-only file:
+                    header  -- b'RCR1', then the WHITE and BLACK names (uint16 length + utf-8)
+                    ply     -- b'P', sense square (uint8), requested move (uint16), taken move (uint16),
+                               captured square (uint8)
+                    result  -- b'R', winner (uint8: 0 BLACK, 1 WHITE, 2 none), reason (uint16 length + utf-8)
+                Squares are 255 when missing and moves are 0xFFFF when missing, otherwise
+                from_square | to_square << 6 | promotion << 12.
+"""
+
+import argparse
+import struct
+import chess
+from background_writer import BackgroundWriter
+from game import Game
+
+MAGIC = b'RCR1'
+
+_PLY = struct.Struct('<BHHB')
+_LENGTH = struct.Struct('<H')
+_NO_SQUARE = 255
+_NO_MOVE = 0xFFFF
+_NO_WINNER = 2
+
+
+def encode_move(move):
+    if not isinstance(move, chess.Move):
+        return _NO_MOVE
+    return move.from_square | move.to_square << 6 | (move.promotion or 0) << 12
+
+
+def decode_move(value):
+    if value == _NO_MOVE:
+        return None
+    return chess.Move(value & 63, value >> 6 & 63, value >> 12 or None)
+
+
+def _encode_square(square):
+    return square if isinstance(square, int) and 0 <= square < 64 else _NO_SQUARE
+
+
+def _decode_square(value):
+    return None if value == _NO_SQUARE else value
+
+
+def _encode_text(text):
+    data = text.encode('utf-8')
+    return _LENGTH.pack(len(data)) + data
+
+
+class GameRecordWriter(object):
+    """
+    Appends the plies of one game to a binary record file. Writes happen on a background thread.
+    """
+
+    def __init__(self, path, white_name, black_name):
+        self.out = BackgroundWriter(path, 'wb')
+        self.out.write(MAGIC + _encode_text(white_name) + _encode_text(black_name))
+
+    def write_ply(self, sense, requested_move, taken_move, captured_square):
+        """
+        :param sense: chess.SQUARE -- the square the player sensed around
+        :param requested_move: chess.Move -- the move the player requested
+        :param taken_move: chess.Move -- the move that was actually taken, None for a pass
+        :param captured_square: chess.SQUARE -- the square of the captured piece, None if nothing was captured
+        """
+        self.out.write(b'P' + _PLY.pack(_encode_square(sense), encode_move(requested_move), encode_move(taken_move),
+                                         _encode_square(captured_square)))
+
+    def write_result(self, winner_color, winner_reason):
+        """
+        :param winner_color: chess.WHITE/chess.BLACK -- the winning color, None for a draw
+        :param winner_reason: str -- the reason for the game ending
+        """
+        winner = _NO_WINNER if winner_color is None else int(winner_color)
+        self.out.write(b'R' + bytes([winner]) + _encode_text(winner_reason or ''))
+
+    def close(self):
+        """
+        Waits until every ply is written and closes the file.
+        """
+        self.out.close()
+
+
+class GameRecord(object):
+    """
+    A game read back from a binary record. Each ply is a tuple of (sense, requested_move, taken_move, captured_square).
+    """
+
+    def __init__(self, white_name, black_name, plies, winner_color=None, winner_reason=None, finished=False):
+        self.white_name = white_name
+        self.black_name = black_name
+        self.plies = plies
+        self.winner_color = winner_color
+        self.winner_reason = winner_reason
+        self.finished = finished
+
+    def replay(self, ply, after_sense=False):
+        """
+        Replays the game through the real game rules.
+
+        :param ply: int -- number of plies to play, 0 for the starting position
+        :param after_sense: bool -- also apply the sense of the next ply, but not its move
+        :return: Game -- the game at that point; its truth_board, white_board and black_board are the boards
+        """
+        game = Game()
+        game.start()
+        for number, (sense, requested_move, taken_move, captured_square) in enumerate(self.plies[:ply + after_sense]):
+            game.handle_sense(sense)
+            if number == ply:
+                break
+            _, replayed_move, _, _ = game.handle_move(requested_move)
+            if replayed_move != taken_move:
+                raise ValueError('ply {} replayed as {} but was recorded as {}'.format(number + 1, replayed_move,
+                                                                                      taken_move))
+            game.end_turn()
+        return game
+
+    def board_at(self, ply, view=None, after_sense=False):
+        """
+        :param ply: int -- number of plies played, 0 for the starting position
+        :param view: chess.WHITE/chess.BLACK for that player's board, None for the truth board
+        :param after_sense: bool -- show the board after the sense of the next ply
+        :return: chess.Board
+        """
+        game = self.replay(ply, after_sense)
+        if view is None:
+            return game.truth_board
+        return game.white_board if view == chess.WHITE else game.black_board
+
+
+def read_game_record(path):
+    """
+    Reads a binary game record. Records of unfinished games are read up to their last complete ply.
+
+    :param path: str -- the record file
+    :return: GameRecord
+    """
+    with open(path, 'rb') as record_file:
+        data = record_file.read()
+
+    if data[:len(MAGIC)] != MAGIC:
+        raise ValueError('{} is not a game record'.format(path))
+
+    offset = len(MAGIC)
+    names = []
+    for _ in range(2):
+        length, = _LENGTH.unpack_from(data, offset)
+        names.append(data[offset + 2:offset + 2 + length].decode('utf-8'))
+        offset += 2 + length
+
+    record = GameRecord(names[0], names[1], [])
+    while offset < len(data):
+        tag = data[offset:offset + 1]
+        if tag == b'P' and offset + 1 + _PLY.size <= len(data):
+            sense, requested_move, taken_move, captured_square = _PLY.unpack_from(data, offset + 1)
+            record.plies.append((_decode_square(sense), decode_move(requested_move), decode_move(taken_move),
+                                 _decode_square(captured_square)))
+            offset += 1 + _PLY.size
+        elif tag == b'R' and offset + 4 <= len(data):
+            winner = data[offset + 1]
+            length, = _LENGTH.unpack_from(data, offset + 2)
+            record.winner_color = None if winner == _NO_WINNER else bool(winner)
+            record.winner_reason = data[offset + 4:offset + 4 + length].decode('utf-8')
+            record.finished = True
+            break
+        else:
+            break
+    return record
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Replays a binary game record.')
+    parser.add_argument('path', help='Path to the game record.')
+    parser.add_argument('--ply', type=int, default=None, help='Show the boards after this many plies, default all.')
+    parser.add_argument('--view', default='truth', choices=['truth', 'white', 'black'], help='Board to show.')
+    parser.add_argument('--after-sense', action='store_true', help='Show the board after the sense of the next ply.')
+    args = parser.parse_args()
+
+    record = read_game_record(args.path)
+    view = {'truth': None, 'white': chess.WHITE, 'black': chess.BLACK}[args.view]
+
+    print("{}-WHITE vs {}-BLACK, {} plies".format(record.white_name, record.black_name, len(record.plies)))
+    if args.ply is None:
+        for number, (sense, requested_move, taken_move, captured_square) in enumerate(record.plies, 1):
+            print("[{}] Sense: {} -- Move requested: {} -- Move taken: {} -- Captured: {}".format(
+                number, chess.SQUARE_NAMES[sense] if sense is not None else None, requested_move, taken_move,
+                chess.SQUARE_NAMES[captured_square] if captured_square is not None else None))
+        print(record.board_at(len(record.plies), view))
+    else:
+        print(record.board_at(args.ply, view, args.after_sense))
+
+    if record.finished:
+        print(record.winner_reason or 'Draw!')
@@ -1,5 +1,9 @@
 import chess
+import multiprocessing
+import random
+import struct
 import time
+from multiprocessing.sharedctypes import RawArray, RawValue
 
 def material_difference(board):
     wK, wQ, wR, wB, wN, wP = 200, 9, 5, 3, 3, 1
@@ -46,127 +50,1073 @@ def evaluate(board):
     return md + pd / 100.
 
 
-def piece_table(piece_type, position):
-    pawns = [0,  0,  0,  0,  0,  0,  0,  0,
-            5, 10, 10,-20,-20, 10, 10,  5,
-            5, -5,-10,  0,  0,-10, -5,  5,
-            0,  0,  0, 20, 20,  0,  0,  0,
-            5,  5, 10, 25, 25, 10,  5,  5,
-            10, 10, 20, 30, 30, 20, 10, 10,
-            50, 50, 50, 50, 50, 50, 50, 50,
-            0,  0,  0,  0,  0,  0,  0,  0]
-        
-    knights = [-50,-40,-30,-30,-30,-30,-40,-50,
-               -40,-20,  0,  5,  5,  0,-20,-40,
-               -30,  5, 10, 15, 15, 10,  5,-30,
-               -30,  0, 15, 20, 20, 15,  0,-30,
-               -30,  5, 15, 20, 20, 15,  5,-30,
-               -30,  0, 10, 15, 15, 10,  0,-30,
-               -40,-20,  0,  0,  0,  0,-20,-40,
-               -50,-40,-30,-30,-30,-30,-40,-50,]
-    
-    bishops = [-20,-10,-10,-10,-10,-10,-10,-20,
-               -10,  5,  0,  0,  0,  0,  5,-10,
-               -10, 10, 10, 10, 10, 10, 10,-10,
-               -10,  0, 10, 10, 10, 10,  0,-10,
-               -10,  5,  5, 10, 10,  5,  5,-10,
-               -10,  0,  5, 10, 10,  5,  0,-10,
-               -10,  0,  0,  0,  0,  0,  0,-10,
-               -20,-10,-10,-10,-10,-10,-10,-20,]
-    
-    rooks = [ 0,  0,  0,  5,  5,  0,  0,  0,
-             -5,  0,  0,  0,  0,  0,  0, -5,
-             -5,  0,  0,  0,  0,  0,  0, -5,
-             -5,  0,  0,  0,  0,  0,  0, -5,
-             -5,  0,  0,  0,  0,  0,  0, -5,
-             -5,  0,  0,  0,  0,  0,  0, -5,
+###=== Piece-square tables, from WHITE's side ===###
+PAWN_TABLE = [0,  0,  0,  0,  0,  0,  0,  0,
+              5, 10, 10,-20,-20, 10, 10,  5,
+              5, -5,-10,  0,  0,-10, -5,  5,
+              0,  0,  0, 20, 20,  0,  0,  0,
+              5,  5, 10, 25, 25, 10,  5,  5,
+              10, 10, 20, 30, 30, 20, 10, 10,
+              50, 50, 50, 50, 50, 50, 50, 50,
+              0,  0,  0,  0,  0,  0,  0,  0]
+
+KNIGHT_TABLE = [-50,-40,-30,-30,-30,-30,-40,-50,
+                -40,-20,  0,  5,  5,  0,-20,-40,
+                -30,  5, 10, 15, 15, 10,  5,-30,
+                -30,  0, 15, 20, 20, 15,  0,-30,
+                -30,  5, 15, 20, 20, 15,  5,-30,
+                -30,  0, 10, 15, 15, 10,  0,-30,
+                -40,-20,  0,  0,  0,  0,-20,-40,
+                -50,-40,-30,-30,-30,-30,-40,-50]
+
+BISHOP_TABLE = [-20,-10,-10,-10,-10,-10,-10,-20,
+                -10,  5,  0,  0,  0,  0,  5,-10,
+                -10, 10, 10, 10, 10, 10, 10,-10,
+                -10,  0, 10, 10, 10, 10,  0,-10,
+                -10,  5,  5, 10, 10,  5,  5,-10,
+                -10,  0,  5, 10, 10,  5,  0,-10,
+                -10,  0,  0,  0,  0,  0,  0,-10,
+                -20,-10,-10,-10,-10,-10,-10,-20]
+
+ROOK_TABLE = [0,  0,  0,  5,  5,  0,  0,  0,
+              -5,  0,  0,  0,  0,  0,  0, -5,
+              -5,  0,  0,  0,  0,  0,  0, -5,
+              -5,  0,  0,  0,  0,  0,  0, -5,
+              -5,  0,  0,  0,  0,  0,  0, -5,
+              -5,  0,  0,  0,  0,  0,  0, -5,
               5, 10, 10, 10, 10, 10, 10,  5,
-              0,  0,  0,  0,  0,  0,  0,  0,]
-    
-    queens = [-20,-10,-10, -5, -5,-10,-10,-20,
-            -10,  0,  5,  0,  0,  0,  0,-10,
-            -10,  5,  5,  5,  5,  5,  0,-10,
-              0,  0,  5,  5,  5,  5,  0, -5,
-             -5,  0,  5,  5,  5,  5,  0, -5,
-            -10,  0,  5,  5,  5,  5,  0,-10,
-            -10,  0,  0,  0,  0,  0,  0,-10,
-            -20,-10,-10, -5, -5,-10,-10,-20,]
-    
-    kings = [20, 30, 10,  0,  0, 10, 30, 20,
-             20, 20,  0,  0,  0,  0, 20, 20,
-            -10,-20,-20,-20,-20,-20,-20,-10,
-            -20,-30,-30,-40,-40,-30,-30,-20,
-            -30,-40,-40,-50,-50,-40,-40,-30,
-            -30,-40,-40,-50,-50,-40,-40,-30,
-            -30,-40,-40,-50,-50,-40,-40,-30,
-            -30,-40,-40,-50,-50,-40,-40,-30,]
-    
-    mapping = dict()
-    mapping[chess.PAWN] = pawns
-    mapping[chess.KNIGHT] = knights
-    mapping[chess.BISHOP] = bishops
-    mapping[chess.ROOK] = rooks
-    mapping[chess.QUEEN] = queens
-    mapping[chess.KING] = kings
-    
-    return mapping[piece_type][position];
+              0,  0,  0,  0,  0,  0,  0,  0]
+
+QUEEN_TABLE = [-20,-10,-10, -5, -5,-10,-10,-20,
+               -10,  0,  5,  0,  0,  0,  0,-10,
+               -10,  5,  5,  5,  5,  5,  0,-10,
+               0,  0,  5,  5,  5,  5,  0, -5,
+               -5,  0,  5,  5,  5,  5,  0, -5,
+               -10,  0,  5,  5,  5,  5,  0,-10,
+               -10,  0,  0,  0,  0,  0,  0,-10,
+               -20,-10,-10, -5, -5,-10,-10,-20]
+
+KING_TABLE = [20, 30, 10,  0,  0, 10, 30, 20,
+              20, 20,  0,  0,  0,  0, 20, 20,
+              -10,-20,-20,-20,-20,-20,-20,-10,
+              -20,-30,-30,-40,-40,-30,-30,-20,
+              -30,-40,-40,-50,-50,-40,-40,-30,
+              -30,-40,-40,-50,-50,-40,-40,-30,
+              -30,-40,-40,-50,-50,-40,-40,-30,
+              -30,-40,-40,-50,-50,-40,-40,-30]
+
+PIECE_TABLES = dict()
+PIECE_TABLES[chess.PAWN] = PAWN_TABLE
+PIECE_TABLES[chess.KNIGHT] = KNIGHT_TABLE
+PIECE_TABLES[chess.BISHOP] = BISHOP_TABLE
+PIECE_TABLES[chess.ROOK] = ROOK_TABLE
+PIECE_TABLES[chess.QUEEN] = QUEEN_TABLE
+PIECE_TABLES[chess.KING] = KING_TABLE
+
+
+def piece_table(piece_type, position):
+    return PIECE_TABLES[piece_type][position]
+
+
+###=== Incremental evaluation ===###
+PIECE_VALUES = {chess.KING: 200, chess.QUEEN: 9, chess.ROOK: 5, chess.BISHOP: 3, chess.KNIGHT: 3, chess.PAWN: 1}
+
+# signed (WHITE positive) material and position scores of a piece, indexed by [color][piece_type][square]
+_MATERIAL = [[0] * 7 for _ in range(2)]
+_POSITION = [[[0] * 64 for _ in range(7)] for _ in range(2)]
+for _piece_type, _value in PIECE_VALUES.items():
+    _MATERIAL[chess.WHITE][_piece_type] = _value
+    _MATERIAL[chess.BLACK][_piece_type] = -_value
+    for _square in chess.SQUARES:
+        _POSITION[chess.WHITE][_piece_type][_square] = piece_table(_piece_type, _square)
+        _POSITION[chess.BLACK][_piece_type][_square] = -piece_table(_piece_type, chess.square_mirror(_square))
+
+
+###=== Zobrist hashing ===###
+_zobrist_random = random.Random(2019)
+
+# keys indexed by [color][piece_type][square]
+ZOBRIST_PIECES = [[[_zobrist_random.getrandbits(64) for _ in chess.SQUARES] for _ in range(7)] for _ in range(2)]
+ZOBRIST_EP = [_zobrist_random.getrandbits(64) for _ in chess.SQUARES]
+ZOBRIST_TURN = _zobrist_random.getrandbits(64)
+
+# castling rights only live on the four corners, so key every subset of them up front
+_ZOBRIST_CORNERS = [_zobrist_random.getrandbits(64) for _ in range(4)]
+_CASTLING_KEYS = dict()
+for _subset in range(16):
+    _rights, _key = 0, 0
+    for _ii, _corner in enumerate([chess.BB_A1, chess.BB_H1, chess.BB_A8, chess.BB_H8]):
+        if _subset & (1 << _ii):
+            _rights |= _corner
+            _key ^= _ZOBRIST_CORNERS[_ii]
+    _CASTLING_KEYS[_rights] = _key
+
+
+def zobrist_hash(board):
+    key = 0
+    for square, piece in board.piece_map().items():
+        key ^= ZOBRIST_PIECES[piece.color][piece.piece_type][square]
+    key ^= _CASTLING_KEYS[board.castling_rights & chess.BB_CORNERS]
+    if board.ep_square is not None:
+        key ^= ZOBRIST_EP[board.ep_square]
+    if board.turn == chess.WHITE:
+        key ^= ZOBRIST_TURN
+    return key
+
+
+def search_state(board):
+    """
+    :return: (int, int, int, bool) -- the Zobrist key, material_difference and position_difference of the board, and
+             whether the move into it captured a king, so False at the root
+    """
+    return zobrist_hash(board), material_difference(board), position_difference(board), False
+
+
+def push_move(node, move, state):
+    """
+    Pushes a pseudo-legal move onto node and updates its search state incrementally. Popping the move needs no update,
+    the caller keeps the state from before the push.
+
+    :param state: (int, int, int, bool) -- the search_state of node before the move
+    :return: (int, int, int, bool) -- the search_state of node after the move
+    """
+    key, material, position, _ = state
+    from_square, to_square = move.from_square, move.to_square
+    color = node.turn
+    ours, theirs = ZOBRIST_PIECES[color], ZOBRIST_PIECES[not color]
+    our_position, their_position = _POSITION[color], _POSITION[not color]
+    piece_type = node.piece_type_at(from_square)
+    captured_type = node.piece_type_at(to_square)
+    moved_type = move.promotion or piece_type
+
+    key ^= ours[piece_type][from_square] ^ ours[moved_type][to_square]
+    material += _MATERIAL[color][moved_type] - _MATERIAL[color][piece_type]
+    position += our_position[moved_type][to_square] - our_position[piece_type][from_square]
+    if captured_type:
+        key ^= theirs[captured_type][to_square]
+        material -= _MATERIAL[not color][captured_type]
+        position -= their_position[captured_type][to_square]
+    elif piece_type == chess.PAWN and to_square == node.ep_square and abs(to_square - from_square) in [7, 9]:
+        captured_square = to_square - 8 if color == chess.WHITE else to_square + 8
+        key ^= theirs[chess.PAWN][captured_square]
+        material -= _MATERIAL[not color][chess.PAWN]
+        position -= their_position[chess.PAWN][captured_square]
+    elif piece_type == chess.KING and abs(to_square - from_square) == 2:
+        # castling also moves the rook
+        if to_square > from_square:
+            rook_from, rook_to = to_square + 1, to_square - 1
+        else:
+            rook_from, rook_to = to_square - 2, to_square + 1
+        key ^= ours[chess.ROOK][rook_from] ^ ours[chess.ROOK][rook_to]
+        position += our_position[chess.ROOK][rook_to] - our_position[chess.ROOK][rook_from]
+
+    key ^= ZOBRIST_TURN ^ _CASTLING_KEYS[node.castling_rights & chess.BB_CORNERS]
+    if node.ep_square is not None:
+        key ^= ZOBRIST_EP[node.ep_square]
+
+    node.push(move)
+
+    key ^= _CASTLING_KEYS[node.castling_rights & chess.BB_CORNERS]
+    if node.ep_square is not None:
+        key ^= ZOBRIST_EP[node.ep_square]
+    return key, material, position, captured_type == chess.KING
+
+
+def push_null_move(node, state):
+    """
+    Passes the turn of node and returns its search state afterwards.
+    """
+    key, material, position, _ = state
+    key ^= ZOBRIST_TURN
+    if node.ep_square is not None:
+        key ^= ZOBRIST_EP[node.ep_square]
+    node.push(chess.Move.null())
+    return key, material, position, False
+
+
+###=== King capture ===###
+# value of capturing the king, less the plies it takes; far above any material score
+KING_CAPTURE_SCORE = 100000
+# values beyond this are king captures
+KING_CAPTURE_BOUND = KING_CAPTURE_SCORE - 1000
+
+
+def king_captured(state, ply):
+    """
+    Only a king taken during the search ends it. A predicted board can be missing a king, and the side without one
+    still plays on.
+
+    :param state: (int, int, int, bool) -- the search_state of the node
+    :return: float -- the value, from the side to move's point of view, of the node if the move into it captured its
+             king, None otherwise
+    """
+    if not state[3]:
+        return None
+    return -(KING_CAPTURE_SCORE - ply)
+
+
+def king_capture(board):
+    """
+    :return: chess.Move -- a pseudo-legal move of the side to move that captures the opponent's king, None if there is
+             none
+    """
+    king = board.king(not board.turn)
+    if king is None:
+        return None
+    attackers = board.attackers_mask(board.turn, king)
+    if not attackers:
+        return None
+    from_square = chess.lsb(attackers)
+    move = chess.Move(from_square, king)
+    if board.pawns & chess.BB_SQUARES[from_square] and chess.BB_SQUARES[king] & chess.BB_BACKRANKS:
+        move.promotion = chess.QUEEN
+    return move
+
+
+def _value_to_table(value, ply):
+    # king captures are stored as distances from the stored node, not from the root
+    if value > KING_CAPTURE_BOUND:
+        return value + ply
+    if value < -KING_CAPTURE_BOUND:
+        return value - ply
+    return value
+
+
+def _value_from_table(value, ply):
+    if value > KING_CAPTURE_BOUND:
+        return value - ply
+    if value < -KING_CAPTURE_BOUND:
+        return value + ply
+    return value
+
+
+###=== Transposition table ===###
+EXACT, LOWER, UPPER = 0, 1, 2
+
+# the same bound seen from BLACK's side, since stored values are from WHITE's side
+_FLIPPED_BOUND = {EXACT: EXACT, LOWER: UPPER, UPPER: LOWER}
+
+
+class TranspositionTable(object):
+    """
+    Fixed-size table of searched positions, indexed by the low bits of their Zobrist key. Each slot holds one
+    (key, depth, bound, value, move, generation) entry. A slot is overwritten when it is empty, when its entry comes
+    from an earlier search, or when the new entry was searched at least as deep.
+    """
+
+    def __init__(self, bits=20):
+        self.mask = (1 << bits) - 1
+        self.entries = [None] * (1 << bits)
+        self.generation = 0
+
+    def new_search(self):
+        self.generation += 1
+
+    def probe(self, key):
+        entry = self.entries[key & self.mask]
+        if entry is not None and entry[0] == key:
+            return entry
+        return None
+
+    def store(self, key, depth, bound, value, move):
+        index = key & self.mask
+        entry = self.entries[index]
+        if entry is None or entry[5] != self.generation or depth >= entry[1]:
+            self.entries[index] = (key, depth, bound, value, move, self.generation)
+
+
+_DOUBLE = struct.Struct('<d')
+_WORD = struct.Struct('<Q')
+_NO_MOVE = 0xFFFF
+
+
+class SharedTranspositionTable(object):
+    """
+    TranspositionTable kept in shared memory, so the processes of a ParallelSearch all read and write the same
+    entries. A slot is three words: the key xor the other two, the packed depth, bound, generation and move, and the
+    value. Writes are not locked; a slot torn by two processes writing at once no longer matches its key, so it reads
+    as empty.
+    """
+
+    def __init__(self, bits=18, entries=None, generation=None, owner=True):
+        """
+        :param entries: RawArray -- words of an existing table to attach to, None to allocate a new one
+        :param generation: RawValue -- generation of an existing table
+        :param owner: bool -- only the owner starts new searches
+        """
+        self.mask = (1 << bits) - 1
+        self.bits = bits
+        self.entries = entries if entries is not None else RawArray('Q', 3 << bits)
+        self.shared_generation = generation if generation is not None else RawValue('B', 0)
+        self.owner = owner
+
+    @property
+    def generation(self):
+        return self.shared_generation.value
+
+    def new_search(self):
+        if self.owner:
+            self.shared_generation.value = (self.shared_generation.value + 1) & 0xFF
+
+    def probe(self, key):
+        index = (key & self.mask) * 3
+        check, data, value_bits = self.entries[index], self.entries[index + 1], self.entries[index + 2]
+        if check ^ data ^ value_bits != key or not data:
+            return None
+        move = data >> 18
+        if move == _NO_MOVE:
+            move = None
+        else:
+            move = chess.Move(move & 63, move >> 6 & 63, move >> 12 or None)
+        value, = _DOUBLE.unpack(_WORD.pack(value_bits))
+        return key, data & 0xFF, data >> 8 & 3, value, move, data >> 10 & 0xFF
+
+    def store(self, key, depth, bound, value, move):
+        index = (key & self.mask) * 3
+        data = self.entries[index + 1]
+        if data and data >> 10 & 0xFF == self.generation and depth < data & 0xFF:
+            return
+        encoded = _NO_MOVE if move is None else move.from_square | move.to_square << 6 | (move.promotion or 0) << 12
+        # a real move never encodes to 0, so only empty slots have no data
+        data = min(max(depth, 0), 0xFF) | bound << 8 | self.generation << 10 | encoded << 18
+        value_bits, = _WORD.unpack(_DOUBLE.pack(value))
+        self.entries[index] = key ^ data ^ value_bits
+        self.entries[index + 1] = data
+        self.entries[index + 2] = value_bits
+
+
+###=== Move ordering ===###
+_TT_SCORE = 1 << 50
+_KING_CAPTURE_SCORE = 1 << 48
+_CAPTURE_SCORE = 1 << 46
+_KILLER_SCORE = 1 << 44
+
+
+class MoveOrderer(object):
+    """
+    Orders the moves of a node so alpha-beta cuts off early: the transposition table move first, then captures by
+    MVV-LVA with king captures ahead of all others, then the two killer moves of the ply, then the remaining quiet
+    moves by their history score. Killers and history are learned from beta cutoffs, so one orderer is kept across
+    the iterations of find_best_move.
+    """
+
+    def __init__(self, max_ply=64):
+        self.killers = [[None, None] for _ in range(max_ply)]
+        # history scores indexed by [color][from_square][to_square]
+        self.history = [[[0] * 64 for _ in range(64)] for _ in range(2)]
+
+    def order(self, node, ply, tt_move=None):
+        """
+        :param node: chess.Board -- the position to order the pseudo-legal moves of
+        :param ply: int -- distance of node from the root
+        :param tt_move: chess.Move -- best move stored for node, None if there is none
+        :return: List(chess.Move) -- the moves, best first
+        """
+        killers = self.killers[ply] if ply < len(self.killers) else [None, None]
+        history = self.history[node.turn]
+        theirs = node.occupied_co[not node.turn]
+        scored = []
+        for move in node.generate_pseudo_legal_moves():
+            if move == tt_move:
+                score = _TT_SCORE
+            elif chess.BB_SQUARES[move.to_square] & theirs:
+                victim = node.piece_type_at(move.to_square)
+                score = _CAPTURE_SCORE + 8 * victim - node.piece_type_at(move.from_square)
+                if victim == chess.KING:
+                    score += _KING_CAPTURE_SCORE
+            elif move == killers[0]:
+                score = _KILLER_SCORE + 1
+            elif move == killers[1]:
+                score = _KILLER_SCORE
+            else:
+                score = history[move.from_square][move.to_square]
+            scored.append((score, move))
+        scored.sort(key=lambda item: item[0], reverse=True)
+        return [move for _, move in scored]
+
+    def cutoff(self, node, move, ply, remaining_depth):
+        """
+        Records a move that caused a beta cutoff at node. Captures are already ordered first and are not recorded.
+        """
+        if chess.BB_SQUARES[move.to_square] & node.occupied_co[not node.turn]:
+            return
+        if ply < len(self.killers):
+            killers = self.killers[ply]
+            if killers[0] != move:
+                killers[1] = killers[0]
+                killers[0] = move
+        self.history[node.turn][move.from_square][move.to_square] += remaining_depth * remaining_depth
+
+
+###=== Principal variation ===###
+MAX_PLY = 64
+
+
+class PrincipalVariation(object):
+    """
+    Triangular table of the best line below each ply. Row ply holds the line from ply onwards, so a new best move at
+    ply is recorded by copying the row of ply + 1 behind it, without copying any board.
+    """
+
+    def __init__(self, max_ply=MAX_PLY):
+        self.moves = [[None] * (max_ply + 1) for _ in range(max_ply + 1)]
+        self.length = [0] * (max_ply + 1)
+
+    def clear(self, ply):
+        self.length[ply] = ply
+
+    def update(self, ply, move):
+        row = self.moves[ply]
+        length = self.length[ply + 1]
+        row[ply] = move
+        row[ply + 1:length] = self.moves[ply + 1][ply + 1:length]
+        self.length[ply] = length
+
+    def line(self):
+        """
+        :return: List(chess.Move) -- the principal variation from the root
+        """
+        return self.moves[0][:self.length[0]]
+
+
+###=== Time management ===###
+# a player's moves in a typical game, and the fewest moves the rest of the clock is ever split over
+EXPECTED_MOVES = 40
+MIN_MOVES_LEFT = 20
+MAX_MOVE_TIME = 15
+# seconds kept back from every move's budget to return the move
+SAFETY_MARGIN = 0.1
+# iterations are expected to take this many times the nodes of the previous one until two have been measured
+DEFAULT_BRANCHING = 5
 
-def minimax(node, depth, isMaximizingPlayer, alpha, beta, max_depth, time_remaining):
-    now = time.time()
-    if time_remaining < 0.1:
-        return None, None
+
+def allocate_time(seconds_left, move_number):
+    """
+    :param seconds_left: float -- seconds left on the game clock
+    :param move_number: int -- moves already played by this player
+    :return: float -- seconds to search this move: an even share of the clock over the moves expected to be left
+    """
+    moves_left = max(EXPECTED_MOVES - move_number, MIN_MOVES_LEFT)
+    return min(seconds_left / moves_left, MAX_MOVE_TIME)
+
+
+class TimeManager(object):
+    """
+    Keeps the clock of one search. Searches count their nodes through poll(), and the clock is only read every
+    poll_nodes nodes. Between iterations, next_iteration_fits() predicts the cost of the next iteration from the node
+    rate so far and how much the last iteration grew, so an iteration that cannot finish is never started.
+    """
+
+    def __init__(self, time_limit, poll_nodes=512):
+        """
+        :param time_limit: float -- seconds the search may take
+        :param poll_nodes: int -- nodes between clock reads
+        """
+        self.start = time.time()
+        self.time_limit = time_limit
+        self.deadline = self.start + time_limit - SAFETY_MARGIN
+        self.poll_nodes = poll_nodes
+        self.nodes = 0
+        self.next_poll = 0
+        self.stopped = False
+
+    def poll(self):
+        """
+        Counts a node.
+
+        :return: bool -- True once the search has run out of time
+        """
+        self.nodes += 1
+        if self.nodes >= self.next_poll:
+            self.next_poll = self.nodes + self.poll_nodes
+            if time.time() >= self.deadline:
+                self.stopped = True
+        return self.stopped
+
+    def next_iteration_fits(self, iteration_nodes, previous_nodes):
+        """
+        :param iteration_nodes: int -- nodes of the iteration that just finished
+        :param previous_nodes: int -- nodes of the iteration before it, 0 if there was none
+        :return: bool -- whether the next iteration is expected to finish before the deadline
+        """
+        now = time.time()
+        if now >= self.deadline:
+            return False
+        elapsed = now - self.start
+        if elapsed <= 0:
+            return True
+        branching = float(iteration_nodes) / previous_nodes if previous_nodes else DEFAULT_BRANCHING
+        rate = self.nodes / elapsed
+        return now + iteration_nodes * max(branching, 1) / rate <= self.deadline
+
+
+###=== Quiescence search ===###
+# margin, in pawns, on top of a capture's material gain before delta pruning gives up on it
+DELTA_MARGIN = 2
+
+
+def quiescence(node, alpha, beta, state, ply, clock=None):
+    """
+    Searches only captures below a leaf, so the leaf is not scored with a piece left hanging. The side to move may
+    stand pat on the static value, and captures that could not raise alpha even with the margin are pruned.
+    Negamax form: values are from the side to move's point of view.
+
+    :param ply: int -- distance of node from the root
+    :param clock: TimeManager -- counts the nodes; capture sequences are short, so they are not cut off
+    :return: float -- the value of node
+    """
+    if clock is not None:
+        clock.poll()
+    lost = king_captured(state, ply)
+    if lost is not None:
+        return lost
+    sign = 1 if node.turn == chess.WHITE else -1
+    stand_pat = sign * (state[1] + state[2] / 100.)
+    if stand_pat >= beta:
+        return stand_pat
+    alpha = max(alpha, stand_pat)
+
+    scored = []
+    for move in node.generate_pseudo_legal_captures():
+        # en passant leaves the target square empty
+        victim = node.piece_type_at(move.to_square) or chess.PAWN
+        if not move.promotion and stand_pat + PIECE_VALUES[victim] + DELTA_MARGIN <= alpha:
+            continue
+        scored.append((8 * victim - node.piece_type_at(move.from_square), move))
+    scored.sort(key=lambda item: item[0], reverse=True)
+
+    for _, move in scored:
+        child_state = push_move(node, move, state)
+        value = -quiescence(node, -beta, -alpha, child_state, ply + 1, clock)
+        node.pop()
+        if value >= beta:
+            return value
+        alpha = max(alpha, value)
+    return alpha
+
+
+def minimax(node, depth, isMaximizingPlayer, alpha, beta, max_depth, clock, table=None, state=None, orderer=None,
+            pv=None):
+    """
+    Alpha-beta search of node, with WHITE maximizing. The principal variation is left in pv.
+
+    :param clock: TimeManager -- the clock of the search
+    :return: float -- the value of node, None if time ran out
+    """
+    if clock.poll():
+        return None
+    if state is None:
+        state = search_state(node)
+    if pv is None:
+        pv = PrincipalVariation()
+    pv.clear(depth)
+    sign = 1 if node.turn == chess.WHITE else -1
+    lost = king_captured(state, depth)
+    if lost is not None:
+        return sign * lost
     if depth == max_depth:
-        return evaluate(node), node.copy()
+        if sign > 0:
+            return quiescence(node, alpha, beta, state, depth, clock)
+        return -quiescence(node, -beta, -alpha, state, depth, clock)
+
+    tt_move = None
+    if table is not None:
+        entry = table.probe(state[0])
+        if entry is not None:
+            _, entry_depth, bound, value, tt_move, _ = entry
+            value = _value_from_table(value, depth)
+            # the root has to be searched to find its move
+            if depth > 0 and entry_depth >= max_depth - depth:
+                if bound == EXACT or (bound == LOWER and value >= beta) or (bound == UPPER and value <= alpha):
+                    return value
+    alpha_start, beta_start = alpha, beta
+    if orderer is None:
+        orderer = MoveOrderer()
 
     if isMaximizingPlayer:
         bestVal = -999999999
-        bestBoard = None
-        for move in node.generate_pseudo_legal_moves():
-            node.push(move)
-            value, board = minimax(node, depth+1, False, alpha, beta, max_depth, time_remaining - (time.time() - now))
+        bestMove = None
+        for move in orderer.order(node, depth, tt_move):
+            child_state = push_move(node, move, state)
+            value = minimax(node, depth+1, False, alpha, beta, max_depth, clock, table, child_state, orderer, pv)
             if value is None:
-                return None, None
+                return None
             node.pop()
             if value > bestVal:
                 bestVal = value
-                bestBoard = board
+                bestMove = move
+                pv.update(depth, move)
             alpha = max(alpha, bestVal)
             if beta <= alpha:
+                orderer.cutoff(node, move, depth, max_depth - depth)
                 break
-        return bestVal, bestBoard
 
     else:
         bestVal = 999999999
-        bestBoard = None
-        for move in node.generate_pseudo_legal_moves():
-            node.push(move)
-            value, board = minimax(node, depth+1, True, alpha, beta, max_depth, time_remaining - (time.time() - now))
+        bestMove = None
+        for move in orderer.order(node, depth, tt_move):
+            child_state = push_move(node, move, state)
+            value = minimax(node, depth+1, True, alpha, beta, max_depth, clock, table, child_state, orderer, pv)
             if value is None:
-                return None, None
+                return None
             node.pop()
             if value < bestVal:
                 bestVal = value
-                bestBoard = board
+                bestMove = move
+                pv.update(depth, move)
             beta = min(beta, bestVal)
             if beta <= alpha:
+                orderer.cutoff(node, move, depth, max_depth - depth)
                 break
-        return bestVal, bestBoard
-    
-def find_best_move(board, time_remaining, color):
-    now = time.time()
-    value, b = minimax(board.copy(stack=False), 0, color, -float('inf'), float('inf'), 1, time_remaining)
-    depth = 2
-    td = time.time() - now
-    while td < time_remaining:
-        candidate, cb = minimax(board.copy(stack=False), 0, color, -float('inf'), float('inf'), depth, time_remaining - td)
-        td = time.time() - now
-        if cb is None:
+
+    if table is not None:
+        if bestVal <= alpha_start:
+            bound = UPPER
+        elif bestVal >= beta_start:
+            bound = LOWER
+        else:
+            bound = EXACT
+        table.store(state[0], max_depth - depth, bound, _value_to_table(bestVal, depth), bestMove)
+    return bestVal
+
+
+###=== Principal variation search ===###
+NULL_WINDOW = 0.001
+NULL_MOVE_REDUCTION = 2
+# quiet moves searched at full depth before the rest are reduced by a ply, and before they are reduced by two
+FULL_DEPTH_MOVES = 3
+REDUCED_MOVES = 8
+
+
+def pvs(node, ply, remaining, alpha, beta, clock, table, state, orderer, pv, null_allowed=True):
+    """
+    Principal variation search of node in negamax form, so values are from the side to move's point of view. Only
+    the first move gets the full window; later moves are searched with a null window and re-searched if they beat
+    alpha. Adds null-move pruning and late-move reductions of quiet moves. Passing is always allowed, since there is no
+    check to pass out of, and it can never dodge a king capture: the opponent's capture after the null move is scored
+    as a lost king like any other.
+
+    :param ply: int -- distance of node from the root
+    :param remaining: int -- plies left to search below node
+    :param clock: TimeManager -- the clock of the search
+    :return: float -- the value of node, None if time ran out
+    """
+    if clock.poll():
+        return None
+    pv.clear(ply)
+    lost = king_captured(state, ply)
+    if lost is not None:
+        return lost
+    sign = 1 if node.turn == chess.WHITE else -1
+    static_value = sign * (state[1] + state[2] / 100.)
+    if remaining <= 0:
+        return quiescence(node, alpha, beta, state, ply, clock)
+
+    # no line from here can end sooner than capturing the king on the next move
+    if ply > 0:
+        alpha = max(alpha, -(KING_CAPTURE_SCORE - ply))
+        beta = min(beta, KING_CAPTURE_SCORE - ply - 1)
+        if alpha >= beta:
+            return alpha
+
+    tt_move = None
+    if table is not None:
+        entry = table.probe(state[0])
+        if entry is not None:
+            _, entry_depth, bound, value, tt_move, _ = entry
+            if ply > 0 and entry_depth >= remaining:
+                value = _value_from_table(sign * value, ply)
+                if sign < 0:
+                    bound = _FLIPPED_BOUND[bound]
+                if bound == EXACT or (bound == LOWER and value >= beta) or (bound == UPPER and value <= alpha):
+                    return value
+    alpha_start = alpha
+    pv_node = beta - alpha > 2 * NULL_WINDOW
+
+    # if passing the turn still fails high, some real move will too; skipped with only pawns left to avoid zugzwang
+    if (null_allowed and not pv_node and ply > 0 and remaining > NULL_MOVE_REDUCTION and static_value >= beta
+            and node.occupied_co[node.turn] & ~(node.pawns | node.kings)):
+        null_state = push_null_move(node, state)
+        value = pvs(node, ply + 1, remaining - 1 - NULL_MOVE_REDUCTION, -beta, -beta + NULL_WINDOW, clock, table,
+                    null_state, orderer, pv, False)
+        if value is None:
+            return None
+        node.pop()
+        if -value >= beta:
+            return beta
+
+    killers = orderer.killers[ply] if ply < len(orderer.killers) else []
+    theirs = node.occupied_co[not node.turn]
+    bestVal = -999999999
+    bestMove = None
+    for index, move in enumerate(orderer.order(node, ply, tt_move)):
+        quiet = not (chess.BB_SQUARES[move.to_square] & theirs or move.promotion or move == tt_move or move in killers)
+        child_state = push_move(node, move, state)
+        if index == 0:
+            value = pvs(node, ply + 1, remaining - 1, -beta, -alpha, clock, table, child_state, orderer, pv)
+        else:
+            reduction = 0
+            if quiet and index >= FULL_DEPTH_MOVES and remaining >= 3:
+                reduction = 2 if index >= REDUCED_MOVES and remaining >= 4 else 1
+            value = pvs(node, ply + 1, remaining - 1 - reduction, -alpha - NULL_WINDOW, -alpha, clock, table,
+                        child_state, orderer, pv)
+            if value is not None and -value > alpha and (reduction or -value < beta):
+                value = pvs(node, ply + 1, remaining - 1, -beta, -alpha, clock, table, child_state, orderer, pv)
+        if value is None:
+            return None
+        node.pop()
+
+        value = -value
+        if value > bestVal:
+            bestVal = value
+            bestMove = move
+            pv.update(ply, move)
+        alpha = max(alpha, bestVal)
+        if alpha >= beta:
+            orderer.cutoff(node, move, ply, remaining)
             break
+
+    if table is not None:
+        if bestVal <= alpha_start:
+            bound = UPPER
+        elif bestVal >= beta:
+            bound = LOWER
         else:
-            value = candidate
-            b = cb
-            depth += 1
-            
-    if b is None:
+            bound = EXACT
+        table.store(state[0], remaining, bound if sign > 0 else _FLIPPED_BOUND[bound],
+                    sign * _value_to_table(bestVal, ply), bestMove)
+    return bestVal
+
+
+def iterative_deepening(board, time_remaining, color, table=None, search='minimax', first_depth=1):
+    """
+    Searches board one ply deeper at a time until time runs out. The transposition table and move ordering are kept
+    across iterations, so each iteration starts from the best line of the previous one; pass a table in to also keep
+    it across turns.
+
+    :param search: str -- 'minimax' for plain alpha-beta or 'pvs' for principal variation search
+    :param first_depth: int -- depth of the first iteration
+    :return: float, List(chess.Move), int -- value (WHITE positive) and principal variation of the deepest finished
+             iteration, and its depth; None, [], 0 if not even depth 1 finished
+    """
+    # taking the king wins on the spot, no search needed
+    move = king_capture(board)
+    if move is not None:
+        value = KING_CAPTURE_SCORE - 1
+        return (value if board.turn == chess.WHITE else -value), [move], 1
+
+    if table is None:
+        table = TranspositionTable()
+    table.new_search()
+    state = search_state(board)
+    orderer = MoveOrderer()
+    pv = PrincipalVariation()
+    node = board.copy(stack=False)
+
+    clock = TimeManager(time_remaining)
+    value, line, depth = None, [], 0
+    target = first_depth
+    previous_nodes = 0
+    while target <= MAX_PLY:
+        start_nodes = clock.nodes
+        if search == 'pvs':
+            candidate = pvs(node, 0, target, -float('inf'), float('inf'), clock, table, state, orderer, pv)
+            if candidate is not None and node.turn == chess.BLACK:
+                candidate = -candidate
+        else:
+            candidate = minimax(node, 0, color, -float('inf'), float('inf'), target, clock, table, state, orderer, pv)
+        if candidate is None:
+            break
+        # an aborted search leaves node part-way down the tree, but a finished one leaves it at the root
+        value, line, depth = candidate, pv.line(), target
+        # a forced king capture will not change with more depth, when both kings are on the board to be captured
+        if abs(value) > KING_CAPTURE_BOUND and board.king(chess.WHITE) is not None \
+                and board.king(chess.BLACK) is not None:
+            break
+        iteration_nodes = clock.nodes - start_nodes
+        if not clock.next_iteration_fits(iteration_nodes, previous_nodes):
+            break
+        previous_nodes = iteration_nodes
+        target += 1
+    return value, line, depth
+
+
+def find_best_move(board, time_remaining, color, table=None, search='minimax'):
+    value, line, depth = iterative_deepening(board, time_remaining, color, table, search)
+    if not line:
         return None
-    return b.move_stack[0]
+    return line[0]
+
+
+###=== Determinized search ===###
+def root_values(node, depth, clock, table, state, orderer, pv, search='minimax'):
+    """
+    Searches every move of node to depth, each with a full window so that every value is exact, not only the best.
+
+    :return: List((chess.Move, float)) -- each pseudo-legal move and its value from the side to move's point of view,
+             None if time ran out
+    """
+    sign = 1 if node.turn == chess.WHITE else -1
+    entry = table.probe(state[0])
+    tt_move = entry[4] if entry is not None else None
+
+    values = []
+    bestVal = -999999999
+    bestMove = None
+    for move in orderer.order(node, 0, tt_move):
+        child_state = push_move(node, move, state)
+        if search == 'pvs':
+            value = pvs(node, 1, depth - 1, -float('inf'), float('inf'), clock, table, child_state, orderer, pv)
+            if value is not None:
+                value = -value
+        else:
+            value = minimax(node, 1, node.turn == chess.WHITE, -float('inf'), float('inf'), depth, clock, table,
+                            child_state, orderer, pv)
+            if value is not None:
+                value = sign * value
+        if value is None:
+            return None
+        node.pop()
+
+        values.append((move, value))
+        if value > bestVal:
+            bestVal = value
+            bestMove = move
+    if bestMove is not None:
+        table.store(state[0], depth, EXACT, sign * bestVal, bestMove)
+    return values
+
+
+def aggregate_values(sample_values, weights):
+    """
+    Weighted mean of the move values of several samples. A move that does not exist on a sample counts as that
+    sample's worst move there. Samples not searched yet, or without moves, are left out.
+
+    :param sample_values: List(List((chess.Move, float))) -- root_values of each sample, None if not searched
+    :param weights: List(float) -- probability of each sample
+    :return: List((chess.Move, float)) -- every move with its weighted value
+    """
+    moves = []
+    seen = set()
+    for values in sample_values:
+        for move, _ in values or []:
+            if move not in seen:
+                seen.add(move)
+                moves.append(move)
+
+    sums = dict((move, 0.0) for move in moves)
+    total_weight = 0.0
+    for values, weight in zip(sample_values, weights):
+        if not values:
+            continue
+        lookup = dict(values)
+        worst = min(lookup.values())
+        for move in moves:
+            sums[move] += weight * lookup.get(move, worst)
+        total_weight += weight
+
+    if total_weight <= 0:
+        return []
+    return [(move, sums[move] / total_weight) for move in moves]
+
+
+def best_of(move_values):
+    """
+    :return: chess.Move -- the move with the highest value, None if there are none
+    """
+    best_move, best_value = None, None
+    for move, value in move_values:
+        if best_value is None or value > best_value:
+            best_move, best_value = move, value
+    return best_move
+
+
+class DeterminizedSearch(object):
+    """
+    Anytime search over several determinizations of the board, each a guess at where the opponent's pieces are with
+    its probability. Every sample gets the same side to move, and all share one transposition table and move
+    orderer. Each step deepens the shallowest sample by a ply, and move_values() can be read between any two steps.
+    Once a step runs out of time the search is over, since that sample's board is left mid-search.
+    """
+
+    def __init__(self, boards, weights, table=None, search='minimax'):
+        """
+        :param boards: List(chess.Board) -- the samples
+        :param weights: List(float) -- probability of each sample
+        :param table: TranspositionTable -- table to share, None for a new one
+        :param search: str -- 'minimax' or 'pvs'
+        """
+        self.boards = [board.copy(stack=False) for board in boards]
+        self.states = [search_state(board) for board in self.boards]
+        self.weights = weights
+        self.table = table if table is not None else TranspositionTable()
+        self.table.new_search()
+        self.orderer = MoveOrderer()
+        self.pv = PrincipalVariation()
+        self.search = search
+        self.values = [None] * len(boards)
+        self.depths = [0] * len(boards)
+
+    def step(self, clock):
+        """
+        :param clock: TimeManager -- the clock of the search
+        :return: bool -- False if time ran out
+        """
+        index = self.depths.index(min(self.depths))
+        values = root_values(self.boards[index], self.depths[index] + 1, clock, self.table, self.states[index],
+                             self.orderer, self.pv, self.search)
+        if values is None:
+            return False
+        self.values[index] = values
+        self.depths[index] += 1
+        return True
+
+    def run(self, time_remaining):
+        """
+        Deepens all samples a ply at a time while the next round is expected to fit in time_remaining.
+
+        :return: chess.Move -- the best move so far
+        """
+        clock = TimeManager(time_remaining)
+        previous_nodes = 0
+        while self.boards and min(self.depths) < MAX_PLY:
+            start_nodes = clock.nodes
+            for _ in self.boards:
+                if not self.step(clock):
+                    return self.best_move()
+            round_nodes = clock.nodes - start_nodes
+            if not clock.next_iteration_fits(round_nodes, previous_nodes):
+                break
+            previous_nodes = round_nodes
+        return self.best_move()
+
+    def move_values(self):
+        """
+        :return: List((chess.Move, float)) -- every move with its value averaged over the searched samples, weighted by
+                 their probability
+        """
+        return aggregate_values(self.values, self.weights)
+
+    def best_move(self):
+        return best_of(self.move_values())
+
+
+###=== Parallel search ===###
+# shared table of the current search worker process, attached by _init_search_worker
+_worker_table = None
+
+
+def _init_search_worker(entries, generation, bits):
+    global _worker_table
+    _worker_table = SharedTranspositionTable(bits, entries, generation, owner=False)
+
+
+def _determinized_worker(job):
+    boards, deadline, search = job
+    # the weights only matter once the samples of all workers are put together
+    determinized = DeterminizedSearch(boards, [1.0] * len(boards), _worker_table, search)
+    determinized.run(deadline - time.time())
+    return determinized.values
+
+
+def _search_worker(job):
+    board, deadline, color, search, index = job
+    # odd helpers start a ply deeper so the workers spread over different depths
+    value, line, depth = iterative_deepening(board, deadline - time.time(), color, _worker_table, search, 1 + index % 2)
+    return value, line, depth, index
+
+
+class ParallelSearch(object):
+    """
+    Lazy SMP search over a process pool. Every worker runs the same iterative deepening on the whole board and they
+    share one transposition table in shared memory, so each worker's results cut off the others' searches. The
+    deepest finished line is played, ties going to the lowest worker. With one worker the search runs in this process
+    on a private table, exactly as find_best_move.
+
+    Determinized searches of several sampled boards are split over the workers instead, each searching its share of
+    the samples on the shared table.
+    """
+
+    def __init__(self, workers=None, bits=18):
+        """
+        :param workers: int -- number of search processes, defaults to the number of cores
+        :param bits: int -- the shared table has 2 ** bits slots
+        """
+        self.workers = workers or multiprocessing.cpu_count()
+        self.pool = None
+        if self.workers > 1:
+            self.table = SharedTranspositionTable(bits)
+            self.pool = multiprocessing.Pool(self.workers, initializer=_init_search_worker,
+                                             initargs=(self.table.entries, self.table.shared_generation, bits))
+        else:
+            self.table = TranspositionTable()
+
+    def search(self, board, time_remaining, color, search='minimax'):
+        """
+        :return: float, List(chess.Move), int -- as iterative_deepening
+        """
+        if self.pool is None:
+            return iterative_deepening(board, time_remaining, color, self.table, search)
+
+        self.table.new_search()
+        deadline = time.time() + time_remaining
+        board = board.copy(stack=False)
+        results = [self.pool.apply_async(_search_worker, ((board, deadline, color, search, index),))
+                   for index in range(self.workers)]
+
+        # workers stop on their own at the deadline, the grace period only covers handing the results back
+        limit = deadline + 0.5
+        best = None, [], 0
+        best_index = self.workers
+        for result in results:
+            try:
+                value, line, depth, index = result.get(max(limit - time.time(), 0))
+            except multiprocessing.TimeoutError:
+                continue
+            if line and (depth > best[2] or (depth == best[2] and index < best_index)):
+                best, best_index = (value, line, depth), index
+        return best
+
+    def find_best_move(self, board, time_remaining, color, search='minimax'):
+        value, line, depth = self.search(board, time_remaining, color, search)
+        if not line:
+            return None
+        return line[0]
+
+    def search_samples(self, boards, weights, time_remaining, search='minimax'):
+        """
+        Determinized search of several possible boards, spread over the workers.
+
+        :return: List((chess.Move, float)) -- as DeterminizedSearch.move_values
+        """
+        if self.pool is None:
+            determinized = DeterminizedSearch(boards, weights, self.table, search)
+            determinized.run(time_remaining)
+            return determinized.move_values()
+
+        self.table.new_search()
+        deadline = time.time() + time_remaining
+        chunks = [list(range(index, len(boards), self.workers)) for index in range(min(self.workers, len(boards)))]
+        results = [self.pool.apply_async(_determinized_worker, (([boards[ii].copy(stack=False) for ii in chunk],
+                                                                  deadline, search),))
+                   for chunk in chunks]
+
+        limit = deadline + 0.5
+        sample_values = [None] * len(boards)
+        for chunk, result in zip(chunks, results):
+            try:
+                values = result.get(max(limit - time.time(), 0))
+            except multiprocessing.TimeoutError:
+                continue
+            for ii, sample in zip(chunk, values):
+                sample_values[ii] = sample
+        return aggregate_values(sample_values, weights)
+
+    def find_best_move_sampled(self, boards, weights, time_remaining, search='minimax'):
+        return best_of(self.search_samples(boards, weights, time_remaining, search))
+
+    def close(self):
+        if self.pool is not None:
+            self.pool.terminate()
+            self.pool.join()
+            self.pool = None
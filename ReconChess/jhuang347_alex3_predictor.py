@@ -2,11 +2,153 @@ import chess
 import numpy as np
 import copy
 
+
+# Movement Tables, indexed by square (rank * 8 + file); 64 pads squares off the board
+def step_targets(deltas):
+    targets = np.zeros((64, 64), dtype=bool)
+    for square in range(0, 64):
+        for file_step, rank_step in deltas:
+            file, rank = (square % 8) + file_step, (square // 8) + rank_step
+            if 0 <= file < 8 and 0 <= rank < 8:
+                targets[square, (rank * 8) + file] = True
+    return targets
+
+
+def ray_squares(directions):
+    rays = np.full((64, len(directions), 7), 64, dtype=np.intp)
+    for square in range(0, 64):
+        for ii, (file_step, rank_step) in enumerate(directions):
+            file, rank = square % 8, square // 8
+            for jj in range(0, 7):
+                file, rank = file + file_step, rank + rank_step
+                if not (0 <= file < 8 and 0 <= rank < 8):
+                    break
+                rays[square, ii, jj] = (rank * 8) + file
+    return rays
+
+
+def pawn_squares(color):
+    forward = 1 if color == chess.WHITE else -1
+    start_rank = 1 if color == chess.WHITE else 6
+    pushes = np.full(64, 64, dtype=np.intp)
+    double_pushes = np.full(64, 64, dtype=np.intp)
+    captures = np.full((64, 2), 64, dtype=np.intp)
+    for square in range(0, 64):
+        file, rank = square % 8, square // 8
+        if not 0 <= rank + forward < 8:
+            continue
+        pushes[square] = square + (8 * forward)
+        if rank == start_rank:
+            double_pushes[square] = square + (16 * forward)
+        for ii, file_step in enumerate([-1, 1]):
+            if 0 <= file + file_step < 8:
+                captures[square, ii] = square + (8 * forward) + file_step
+    return pushes, double_pushes, captures
+
+
+KNIGHT_TARGETS = step_targets([(1, 2), (2, 1), (2, -1), (1, -2), (-1, -2), (-2, -1), (-2, 1), (-1, 2)])
+KING_TARGETS = step_targets([(1, 0), (1, 1), (0, 1), (-1, 1), (-1, 0), (-1, -1), (0, -1), (1, -1)])
+ROOK_RAYS = ray_squares([(1, 0), (0, 1), (-1, 0), (0, -1)])
+BISHOP_RAYS = ray_squares([(1, 1), (-1, 1), (-1, -1), (1, -1)])
+PAWN_SQUARES = {chess.WHITE: pawn_squares(chess.WHITE), chess.BLACK: pawn_squares(chess.BLACK)}
+
+# Knights and kings reach the same squares on every board, only the blocked ones drop out
+STEP_MOVES = {chess.KNIGHT: KNIGHT_TARGETS.astype(np.float64), chess.KING: KING_TARGETS.astype(np.float64)}
+
+# Rook then bishop directions, walked together and each ending off the board at 64
+SLIDER_RAYS = np.concatenate([np.concatenate([ROOK_RAYS, BISHOP_RAYS], axis=1), np.full((64, 8, 1), 64)], axis=2)
+_OFF_BOARD = SLIDER_RAYS == 64
+_RAY_STEPS = np.arange(8)
+# Position of every ray square in the flattened (2, 64, 65) rook and bishop targets
+_SLIDER_CELLS = (np.repeat([0, 1], 4)[None, :, None] * 64 * 65) + (np.arange(64)[:, None, None] * 65) + SLIDER_RAYS
+_PAWN_SOURCES = np.arange(64)
+
+
+# Squares rooks and bishops reach, stopping at the first blocker and taking it only if capturable
+def slide_targets(blockers, capturable):
+    blocked = blockers[SLIDER_RAYS] | _OFF_BOARD
+    first_blocked = blocked.argmax(axis=2)[:, :, None]
+    reach = (_RAY_STEPS <= first_blocked) & (~blocked | capturable[SLIDER_RAYS])
+    targets = np.zeros(2 * 64 * 65)
+    targets[_SLIDER_CELLS[reach]] = 1.0
+    targets = targets.reshape(2, 64, 65)
+    return targets[0, :, :64], targets[1, :, :64]
+
+
+# Squares each pawn reaches: pushes onto empty squares, diagonals onto capturable pieces
+def pawn_targets(color, blockers, capturable):
+    pushes, double_pushes, captures = PAWN_SQUARES[color]
+    targets = np.zeros((64, 65))
+    targets[_PAWN_SOURCES, pushes] = ~blockers[pushes]
+    targets[_PAWN_SOURCES, double_pushes] = ~blockers[pushes] & ~blockers[double_pushes]
+    for ii in range(0, 2):
+        targets[_PAWN_SOURCES, captures[:, ii]] = capturable[captures[:, ii]]
+    return targets[:, :64]
+
+
+# Reachability of the piece types that depend on the occupancy, as (64, 64) from/to matrices of 0 and 1
+def movement_targets(color, blockers, capturable):
+    rook_targets, bishop_targets = slide_targets(blockers, capturable)
+    return {chess.PAWN: pawn_targets(color, blockers, capturable),
+            chess.BISHOP: bishop_targets,
+            chess.ROOK: rook_targets,
+            chess.QUEEN: bishop_targets + rook_targets}
+
+
+# Column for each row with the largest total score (Hungarian method), -1 for rows left without a column
+def best_assignment(scores):
+    rows, cols = scores.shape
+    if rows > cols:
+        assignment = np.full(rows, -1, dtype=np.intp)
+        assignment[best_assignment(scores.T)] = np.arange(cols)
+        return assignment
+
+    # Every row taking the last of its best columns is optimal when no column is taken twice
+    greedy = cols - 1 - scores[:, ::-1].argmax(axis=1)
+    if len(np.unique(greedy)) == rows:
+        return greedy
+
+    # Minimize cost with row potentials u and column potentials v, column 0 is a dummy
+    cost = scores.max() - scores
+    u = np.zeros(rows + 1)
+    v = np.zeros(cols + 1)
+    col2row = np.zeros(cols + 1, dtype=np.intp)
+    way = np.zeros(cols + 1, dtype=np.intp)
+    for row in range(1, rows + 1):
+        col2row[0] = row
+        col = 0
+        min_slack = np.full(cols + 1, np.inf)
+        used = np.zeros(cols + 1, dtype=bool)
+        while col2row[col] != 0:
+            used[col] = True
+            slack = cost[col2row[col] - 1] - u[col2row[col]] - v[1:]
+            better = ~used[1:] & (slack < min_slack[1:])
+            min_slack[1:][better] = slack[better]
+            way[1:][better] = col
+            free_slack = np.where(used[1:], np.inf, min_slack[1:])
+            next_col = free_slack.argmin() + 1
+            delta = free_slack[next_col - 1]
+            u[col2row[used]] += delta
+            v[used] -= delta
+            min_slack[~used] -= delta
+            col = next_col
+
+        # Flip the augmenting path
+        while col != 0:
+            col2row[col] = col2row[way[col]]
+            col = way[col]
+
+    assignment = np.full(rows, -1, dtype=np.intp)
+    assigned = np.flatnonzero(col2row[1:])
+    assignment[col2row[assigned + 1] - 1] = assigned
+    return assignment
+
+
 class Predictor(object):
     
     def __init__(self, color):
-        # Setup Board
-        self.predicted_board = chess.Board()
+        # Setup Board, built from the beliefs when first needed
+        self.predicted_board = None
         white_fen = "8/8/8/8/8/8/PPPPPPPP/RNBQKBNR w KQkq - 0 1"
         black_fen = "rnbqkbnr/pppppppp/8/8/8/8/8/8 w KQkq - 0 1"
         if color == chess.WHITE:
@@ -41,6 +183,15 @@ class Predictor(object):
             else:
                 self.piece_type2indices[piece_type] = [ii]
 
+        # Pieces ordered by type, so each type's planes are one slice
+        self.type_order = list()
+        self.type_slices = list()
+        for piece_type in sorted(self.piece_type2indices):
+            indices = self.piece_type2indices[piece_type]
+            self.type_slices.append((piece_type, len(self.type_order), len(self.type_order) + len(indices)))
+            self.type_order.extend(indices)
+        self.type_order = np.array(self.type_order)
+
         # Setup Probabilies
         self.probability_board = np.zeros((16, 8, 8), dtype=np.float)
         for jj in range(0, 2):
@@ -57,15 +208,67 @@ class Predictor(object):
 
     def predict_board(self, your_board):
         self.your_board = your_board
-        self.update_piece_location_dict()
-        self.set_pieces_position(your_board)
+        self.invalidate_predicted_board()
         return self.get_predicted_board()
 
         
+    # Build the predicted board on the first access after the beliefs changed
     def get_predicted_board(self):
+        if self.predicted_board is None:
+            self.set_pieces_position(self.your_board)
         return self.predicted_board
 
 
+    def invalidate_predicted_board(self):
+        self.predicted_board = None
+
+
+    # Draw placements of the opponent's pieces from the probability board
+    # Returns the distinct boards and their probabilities, normalized to sum to 1
+    def sample_boards(self, your_board, count, random_state=np.random):
+        planes = np.transpose(self.probability_board, (0, 2, 1)).reshape(16, 64)
+        totals = planes.sum(axis=1)
+        own_squares = list(chess.scan_forward(your_board.occupied))
+
+        placements = list()
+        probabilities = dict()
+        for _ in range(count):
+            weights = planes.copy()
+            weights[:, own_squares] = 0.0
+            placement = list()
+            probability = 1.0
+            for ii in range(0, 16):
+                total = weights[ii].sum()
+
+                # Dead, or no free square left
+                if totals[ii] <= 0.0 or total <= 0.0:
+                    continue
+
+                square = random_state.choice(64, p=weights[ii] / total)
+                probability *= weights[ii, square] / totals[ii]
+                placement.append((ii, square))
+
+                # No other piece on the same square
+                weights[:, square] = 0.0
+
+            placement = tuple(placement)
+            if placement not in probabilities:
+                placements.append(placement)
+            probabilities[placement] = probability
+
+        # Build Boards
+        boards = list()
+        for placement in placements:
+            board = your_board.copy()
+            for ii, square in placement:
+                board.set_piece_at(square, chess.Piece(self.idx2pieces[ii][0], self.opponentcolor))
+            boards.append(board)
+
+        total = sum(probabilities.values())
+        weights = [probabilities[placement] / total for placement in placements]
+        return boards, weights
+
+
     def set_predicted_board(self, board):
         self.predicted_board = board
 
@@ -74,21 +277,37 @@ class Predictor(object):
         self.your_board = board
 
 
-    def update_piece_location_dict(self):
-        self.loc2piece_idx = dict()
-        self.piece_idx2loc = np.ones((16, 2), dtype=np.int) * -1
-
-        # Save Positions
-        for ii in range(16):
-            position = np.unravel_index(self.probability_board[ii].argmax(), (8, 8))
-            
-            # Check if dead
-            if self.probability_board[ii, position[0], position[1]] == 0.0:
-                position = (-1, -1)
-            
-            # Save
-            self.loc2piece_idx[position] = ii
-            self.piece_idx2loc[ii] = np.array(position)
+    # Refresh the most likely positions of the given pieces, or of all 16 when indices is None
+    def update_piece_location_dict(self, indices=None):
+        full = indices is None
+        if full:
+            indices = np.arange(16)
+            self.piece_idx2loc = np.ones((16, 2), dtype=np.int) * -1
+        else:
+            indices = np.unique(np.asarray(indices, dtype=np.intp))
+            if len(indices) == 0:
+                return
+            old_positions = [tuple(position) for position in self.piece_idx2loc[indices].tolist()]
+
+        # Argmax of every changed plane at once, dead pieces at (-1, -1)
+        planes = self.probability_board.reshape(16, 64)[indices]
+        best = planes.argmax(axis=1)
+        alive = planes[np.arange(len(indices)), best] != 0.0
+        self.piece_idx2loc[indices] = -1
+        self.piece_idx2loc[indices[alive], 0] = best[alive] // 8
+        self.piece_idx2loc[indices[alive], 1] = best[alive] % 8
+
+        # The largest index keeps a shared position
+        locations = [tuple(position) for position in self.piece_idx2loc.tolist()]
+        if full:
+            self.loc2piece_idx = dict(zip(locations, range(16)))
+            return
+        for position in set(old_positions + [locations[idx] for idx in indices]):
+            at = [idx for idx in range(16) if locations[idx] == position]
+            if len(at) > 0:
+                self.loc2piece_idx[position] = at[-1]
+            else:
+                self.loc2piece_idx.pop(position, None)
 
 
     # Set predicted board with the stored positional values
@@ -131,55 +350,56 @@ class Predictor(object):
             
             # Changed Probablility to match Sense
             self.probability_board[best_idx, position[0], position[1]] = 2.0
+            self.update_piece_location_dict([best_idx])
 
         else:
-            self.opponent_prob_step()
+            self.opponent_transition_step()
+            self.update_piece_location_dict()
 
         # Update Predict Board
-        self.update_piece_location_dict()
-        self.set_pieces_position(self.your_board)
+        self.invalidate_predicted_board()
         
 
 
-    def opponent_prob_step(self):
-        # Generate Legal Moves
-        self.predicted_board.turn = self.opponentcolor
-        legal_moves = [mm for mm in self.predicted_board.legal_moves]
-        num_legal_moves = len(legal_moves)
-
-        # Convert Points
-        moves_by_piece = [list() for ii in range(0, 16)]
-        for move in legal_moves:
-            s_point = move.from_square
-            d_point = move.to_square
-
-            # Split legal to individual Pieces
-            position = self.square2point(s_point)
-            idx = self.loc2piece_idx[position]
-            moves_by_piece[idx].append(d_point)
-
-        # HMM on each Piece
-        action_prob = 1.0/num_legal_moves if num_legal_moves else 1.0
-        for ii in range(0, 16):
-
-            # Values
-            moves = moves_by_piece[ii]
-            if len(moves) != 0:
-                s_position = self.piece_idx2loc[ii]
-                s_position_prob = self.probability_board[ii, s_position[0], s_position[1]]
-
-                # Loop on Actions
-                for move in moves:
-                    t_position = self.square2point(move)
-                    self.probability_board[ii, t_position[0], t_position[1]] += action_prob * s_position_prob
+    # HMM step on the whole distribution: probability on every square moves, not only on the most likely one
+    def opponent_transition_step(self):
+        # Occupancy: your pieces can be captured, opponent pieces block on their most likely squares
+        capturable = np.zeros(65, dtype=bool)
+        capturable[list(chess.scan_forward(self.your_board.occupied))] = True
+        locations = self.piece_idx2loc[self.type_order]
+        alive = np.flatnonzero(locations[:, 0] >= 0)
+        squares = (locations[alive, 1] * 8) + locations[alive, 0]
+        blockers = capturable.copy()
+        blockers[squares] = True
+        capturable[squares] = False
+        targets = movement_targets(self.opponentcolor, blockers, capturable)
+        free = (~blockers[:64] | capturable[:64]).astype(np.float64)
+
+        # Every move of the most likely board is equally likely
+        planes = np.transpose(self.probability_board, (0, 2, 1)).reshape(16, 64)[self.type_order]
+        num_moves = np.empty((16, 64))
+        moved = np.empty((16, 64))
+        for piece_type, start, stop in self.type_slices:
+            if piece_type in STEP_MOVES:
+                # masking target columns commutes with the product, so the fixed table is used as is
+                num_moves[start:stop] = np.dot(STEP_MOVES[piece_type], free)
+                moved[start:stop] = np.dot(planes[start:stop], STEP_MOVES[piece_type]) * free
+            else:
+                num_moves[start:stop] = targets[piece_type].sum(axis=1)
+                moved[start:stop] = np.dot(planes[start:stop], targets[piece_type])
+        num_legal_moves = num_moves[alive, squares].sum()
+        if num_legal_moves == 0:
+            return
+        action_prob = 1.0 / num_legal_moves
 
-                # Prob of staying
-                self.probability_board[ii, s_position[0], s_position[1]] += s_position_prob * (1 - (action_prob * len(moves)))
-            
-                # Normalize Probability
-                p_sum = np.sum(self.probability_board[ii])
-                self.probability_board[ii] /= p_sum
+        # Move and stay, over (16, 64) planes by square
+        planes = (moved * action_prob) + (planes * np.maximum(1 - (action_prob * num_moves), 0.0))
 
+        # Normalize Probability, dead pieces stay at zero
+        p_sum = planes.sum(axis=1, keepdims=True)
+        p_sum[p_sum == 0] = 1.0
+        planes /= p_sum
+        self.probability_board[self.type_order] = np.transpose(planes.reshape(16, 8, 8), (0, 2, 1))
 
 
     def square2point(self, square):
@@ -200,67 +420,69 @@ class Predictor(object):
                 
                 # Changed Probablility to match observation
                 self.probability_board[best_idx, :, :] = 0.0
+                self.update_piece_location_dict([best_idx])
         else:
             # TODO Not Sure what to do here
             pass
 
         # Update Predict Board
-        self.update_piece_location_dict()
-        self.set_pieces_position(self.your_board)
+        self.invalidate_predicted_board()
  
 
     def sense_update(self, sense_result):
-        for result in sense_result:
-            position = self.square2point(result[0])
-            piece = result[1]
+        squares = np.array([result[0] for result in sense_result], dtype=np.intp)
+        emptied = np.array([result[1] == None or result[1].color == self.mycolor for result in sense_result], dtype=bool)
+
+        # Clear empty squares and your pieces in every plane at once
+        # Only pieces most likely on those squares can move elsewhere
+        self.probability_board[:, squares[emptied] % 8, squares[emptied] // 8] = 0.0
+        locations = (self.piece_idx2loc[:, 1] * 8) + self.piece_idx2loc[:, 0]
+        changed = list(np.flatnonzero(np.isin(locations, squares[emptied])))
+
+        # Match the sensed pieces of each type to that type's pieces together
+        sensed = [(ii, result[1].piece_type) for ii, result in enumerate(sense_result) if not emptied[ii]]
+        if len(sensed) > 0:
+            scores = self.identity_scores(squares[[ii for ii, _ in sensed]], range(0, 16))
+        for piece_type, indices in self.piece_type2indices.items():
+            rows = [row for row, (_, sensed_type) in enumerate(sensed) if sensed_type == piece_type]
+            if len(rows) == 0:
+                continue
+            assignment = best_assignment(scores[np.ix_(rows, indices)])
 
-            if piece == None or piece.color == self.mycolor:
-                self.probability_board[:, position[0], position[1]] = 0.0
-            else:
-                # Find most likely piece was moved to get there
-                best_prob = 0.0
-                best_idx = None
-                for idx in self.piece_type2indices[piece.piece_type]:
-                    current_posiiton = self.piece_idx2loc[idx]
-                    current_posiiton = self.point2square(current_posiiton)
-                    prob = self.probability_board[idx, position[0], position[1]] + (1 - chess.square_distance(result[0], current_posiiton)/16.0)
-
-                    if prob >= best_prob:
-                        best_prob = prob
-                        best_idx = idx
-                
-                # Changed Probablility to match Sense
-                self.probability_board[best_idx, :, :] = 0.0
-                self.probability_board[best_idx, position[0], position[1]] = 1.0
+            # Changed Probablility to match Sense
+            for row, column in zip(rows, assignment):
+                if column < 0:
+                    continue
+                position = self.square2point(squares[sensed[row][0]])
+                self.probability_board[indices[column], :, :] = 0.0
+                self.probability_board[indices[column], position[0], position[1]] = 1.0
+                changed.append(indices[column])
 
         # Update Predict Board
-        self.update_piece_location_dict()
-        self.set_pieces_position(self.your_board)
+        self.update_piece_location_dict(changed)
+        self.invalidate_predicted_board()
 
 
-    def mostly_likely_piece(self, captured_square):
-        position = self.square2point(captured_square)
-
-        # Find most likely piece was moved to get there
-        best_prob = 0.0
-        best_idx = None
-        for idx in range(0, 16):
-            current_posiiton = self.piece_idx2loc[idx]
-            current_posiiton = self.point2square(current_posiiton)
-            prob = self.probability_board[idx, position[0], position[1]] + (1 - chess.square_distance(captured_square, current_posiiton)/16.0)
+    # Score of each piece for each square: its probability there plus how close its most likely square is
+    def identity_scores(self, squares, indices):
+        squares = np.asarray(squares, dtype=np.intp)[:, None]
+        indices = np.asarray(indices, dtype=np.intp)[None, :]
+        locations = (self.piece_idx2loc[indices, 1] * 8) + self.piece_idx2loc[indices, 0]
+        distance = np.maximum(np.abs((squares & 7) - (locations & 7)), np.abs((squares >> 3) - (locations >> 3)))
+        return self.probability_board[indices, squares % 8, squares // 8] + (1 - (distance / 16.0))
 
-            if prob >= best_prob:
-                best_prob = prob
-                best_idx = idx
 
-        return best_idx
+    def mostly_likely_piece(self, captured_square):
+        # Find most likely piece was moved to get there
+        return int(best_assignment(self.identity_scores([captured_square], range(0, 16)))[0])
 
 
 def main():
     # TEST
     predictor = Predictor(chess.WHITE)
 
-    predictor.opponent_prob_step()
+    predictor.opponent_transition_step()
+    predictor.update_piece_location_dict()
     print(predictor.probability_board[2])
     board = chess.Board()
     board.clear_board()
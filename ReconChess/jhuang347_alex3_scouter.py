@@ -1,5 +1,6 @@
 import chess
 import random
+from game import SENSE_SQUARES
 
 
 class Scouter:
@@ -29,13 +30,8 @@ class Scouter:
     def update_scout_history(self, move, player_board):
         # TODO: Scout history should be 0 where our pieces are
         self.scout_history = [x + 1 for x in self.scout_history]
-        fil, rank = chess.square_file(move), chess.square_rank(move)
-        for i in [-1, 0, 1]:
-            for j in [-1, 0, 1]:
-                x = fil + i
-                y = rank + j
-                if 0 <= x < 8 and 0 <= y < 8:
-                    self.scout_history[chess.square(x, y)] = 0
+        for square in SENSE_SQUARES[move]:
+            self.scout_history[square] = 0
 
         for square, piece in player_board.piece_map().items():
             if piece.color == self.color:
@@ -52,12 +48,4 @@ class Scouter:
 
 
     def _get_history_sum(self, square):
-        value = 0
-        fil, rank = chess.square_file(square), chess.square_rank(square)
-        for i in [-1, 0, 1]:
-            for j in [-1, 0, 1]:
-                x = fil + i
-                y = rank + j
-                if 0 <= x < 8 and 0 <= y < 8:
-                    value += self.scout_history[chess.square(x, y)]
-        return value
+        return sum(self.scout_history[s] for s in SENSE_SQUARES[square])
@@ -9,15 +9,22 @@ Description:    Python file for my agent.
 Source:         Adapted from recon-chess (https://pypi.org/project/reconchess/)
 """
 
+import random
 import chess
+import numpy as np
 from player import Player
-from jhuang347_alex3_mover import find_best_move
+from jhuang347_alex3_mover import ParallelSearch, allocate_time
 from jhuang347_alex3_scouter import Scouter
 from jhuang347_alex3_predictor import Predictor
 
 
 class MDP_Only(Player):
 
+    # search processes per move; agents run inside tournament pool workers, which cannot start their own pool
+    workers = 1
+    # boards sampled from the predictor's beliefs and searched together, 1 to search only the predicted board
+    samples = 1
+
     def __init__(self):
         self.turn = -1
         self.board = chess.Board()
@@ -36,6 +43,10 @@ class MDP_Only(Player):
         self.color = color
         self.scouter = Scouter(color)
         self.predictor = Predictor(color)
+        self.searcher = ParallelSearch(self.workers)
+        # numpy state for sampling boards, drawn from random so seeding random reproduces the samples too
+        self.random_state = np.random.RandomState(random.getrandbits(32))
+        self.search = 'pvs'
         white_fen = "8/8/8/8/8/8/PPPPPPPP/RNBQKBNR w KQkq - 0 1"
         black_fen = "rnbqkbnr/pppppppp/8/8/8/8/8/8 w KQkq - 0 1"
         if color == chess.WHITE:
@@ -104,13 +115,22 @@ class MDP_Only(Player):
         :example: choice = chess.Move(chess.G7, chess.G8, promotion=chess.KNIGHT) *default is Queen
         """
         # print("choose_move")
+        budget = allocate_time(seconds_left, self.turn)
+        if self.samples > 1:
+            boards, weights = self.predictor.sample_boards(self.players_board, self.samples, self.random_state)
+            for board in boards:
+                for square, piece in self.sense_result:
+                    board.set_piece_at(square, piece)
+                board.turn = self.color
+            return self.searcher.find_best_move_sampled(boards, weights, budget, self.search)
+
         predicted_board = self.predictor.predict_board(self.players_board)
         for square, piece in self.sense_result:
             predicted_board.set_piece_at(square, piece)
         predicted_board.turn = self.color
-        print("Prediction")
-        print(predicted_board)
-        choice = find_best_move(predicted_board, min(5, seconds_left), self.color)
+        # print("Prediction")
+        # print(predicted_board)
+        choice = self.searcher.find_best_move(predicted_board, budget, self.color, self.search)
         return choice
         
     def handle_move_result(self, requested_move, taken_move, reason, captured_piece, captured_square):
@@ -138,4 +158,4 @@ class MDP_Only(Player):
         :param winner_color: Chess.BLACK/chess.WHITE -- the winning color
         :param win_reason: String -- the reason for the game ending
         """
-        pass
+        self.searcher.close()
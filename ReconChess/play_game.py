@@ -11,74 +11,143 @@ Source:         Adapted from recon-chess (https://pypi.org/project/reconchess/)
 
 import argparse
 import random
+from collections import namedtuple
 import chess
 from player import load_player
+from background_writer import BackgroundWriter
 from game import Game
+from game_record import GameRecordWriter
 from datetime import datetime
 import time
 
 
-def play_local_game(white_player, black_player, player_names):
+# compact record of a finished game, returned by headless games
+GameResult = namedtuple('GameResult', ['white_name', 'black_name', 'winner_color', 'winner_reason', 'turns'])
+
+
+def play_local_game(white_player, black_player, player_names, headless=False, text_history=False, record_path=None):
+    """
+    Plays a game between two players. The game is recorded as a binary game record in GameHistory/.
+
+    :param headless: bool -- skip all printing and GameHistory files, and return a GameResult instead
+    :param text_history: bool -- also write the board-by-board text dumps to GameHistory/
+    :param record_path: str -- where to write the binary game record, also used by headless games
+    :return: chess.WHITE/chess.BLACK/None, str -- the winning color and reason, or a GameResult if headless
+    """
+    if headless:
+        return play_headless_game(white_player, black_player, player_names, record_path)
+
     players = [black_player, white_player]
 
     game = Game()
 
-    # writing to files
+    # writing to files, on background threads so the writes are not charged to the players' clocks
     time = "{}".format(datetime.today()).replace(" ", "_").replace(":", "-").replace(".", "-")
-    filename_game = "GameHistory/" + time + "game_boards.txt"
-    filename_true = "GameHistory/" + time + "true_boards.txt"
-    output = open(filename_game, "w")
-    output_true = open(filename_true, "w")
-    output.write("Starting Game between {}-WHITE and {}-BLACK\n".format(player_names[0], player_names[1]))
-    output_true.write("Starting Game between {}-WHITE and {}-BLACK\n".format(player_names[0], player_names[1]))
-
-    white_player.handle_game_start(chess.WHITE, chess.Board())
-    black_player.handle_game_start(chess.BLACK, chess.Board())
-    game.start()
-
-    move_number = 1
-    while not game.is_over():
-        if game.turn:
-            output.write("##################################--WHITE's Turn [{}]\n".format(move_number))
-            output.write("##################################--Current Board State\n")
-            format_write_board(output, game.white_board)
-            output_true.write("##################################--WHITE's Turn [{}]\n".format(move_number))
+    record = GameRecordWriter(record_path or "GameHistory/" + time + "game.rcr", player_names[0], player_names[1])
+    output = output_true = None
+    if text_history:
+        filename_game = "GameHistory/" + time + "game_boards.txt"
+        filename_true = "GameHistory/" + time + "true_boards.txt"
+        output = BackgroundWriter(filename_game)
+        output_true = BackgroundWriter(filename_true)
+        output.write("Starting Game between {}-WHITE and {}-BLACK\n".format(player_names[0], player_names[1]))
+        output_true.write("Starting Game between {}-WHITE and {}-BLACK\n".format(player_names[0], player_names[1]))
+
+    try:
+        white_player.handle_game_start(chess.WHITE, chess.Board())
+        black_player.handle_game_start(chess.BLACK, chess.Board())
+        game.start()
+
+        move_number = 1
+        while not game.is_over():
+            if game.turn:
+                if text_history:
+                    output.write("##################################--WHITE's Turn [{}]\n".format(move_number))
+                    output.write("##################################--Current Board State\n")
+                    format_write_board(output, game.white_board)
+                    output_true.write("##################################--WHITE's Turn [{}]\n".format(move_number))
+
+                print("WHITE's Turn [{}]".format(move_number))
+                format_print_board(game.white_board)
+
+            else:
+                if text_history:
+                    output.write("##################################--BLACK's Turn [{}]\n".format(move_number))
+                    output.write("##################################--Current Board State \n")
+                    format_write_board(output, game.black_board)
+                    output_true.write("##################################--BLACK's Turn [{}]\n".format(move_number))
+
+                print("BLACK's Turn [{}]".format(move_number))
+                format_print_board(game.black_board)
+
+            if text_history:
+                output_true.write("##################################--Current Board State\n")
+                format_write_board(output_true, game.truth_board)
+
+            requested_move, taken_move = play_turn(game, players[game.turn], game.turn, move_number, output,
+                                                   output_true, record=record)
+            print_game(game, move_number, game.turn, requested_move, taken_move)
+            move_number += 1
+
+            print("==================================\n")
+
+        winner_color, winner_reason = game.get_winner()
+
+        white_player.handle_game_end(winner_color, winner_reason)
+        black_player.handle_game_end(winner_color, winner_reason)
+
+        record.write_result(winner_color, winner_reason)
+        if text_history:
+            output.write("Game Over!\n")
+            if winner_color is not None:
+                output.write(winner_reason)
+            else:
+                output.write('Draw!')
+    finally:
+        # drain everything still queued before returning
+        record.close()
+        if text_history:
+            output.close()
+            output_true.close()
+    return winner_color, winner_reason
 
-            print("WHITE's Turn [{}]".format(move_number))
-            format_print_board(game.white_board)
 
-        else:
-            output.write("##################################--BLACK's Turn [{}]\n".format(move_number))
-            output.write("##################################--Current Board State \n")
-            format_write_board(output, game.black_board)
-            output_true.write("##################################--BLACK's Turn [{}]\n".format(move_number))
+def play_headless_game(white_player, black_player, player_names, record_path=None):
+    """
+    Plays a game without any rendering or text output.
 
-            print("BLACK's Turn [{}]".format(move_number))
-            format_print_board(game.black_board)
+    :param record_path: str -- where to write the binary game record, None to skip it
+    :return: GameResult -- the names, winner and number of turns played
+    """
+    players = [black_player, white_player]
 
-        output_true.write("##################################--Current Board State\n")
-        format_write_board(output_true, game.truth_board)
+    game = Game()
+    record = GameRecordWriter(record_path, player_names[0], player_names[1]) if record_path else None
 
-        requested_move, taken_move = play_turn(game, players[game.turn], game.turn, move_number, output, output_true)
-        print_game(game, move_number, game.turn, requested_move, taken_move)
-        move_number += 1
+    try:
+        white_player.handle_game_start(chess.WHITE, chess.Board())
+        black_player.handle_game_start(chess.BLACK, chess.Board())
+        game.start()
 
-        print("==================================\n")
+        move_number = 1
+        while not game.is_over():
+            play_turn(game, players[game.turn], game.turn, move_number, headless=True, record=record)
+            move_number += 1
 
-    winner_color, winner_reason = game.get_winner()
+        winner_color, winner_reason = game.get_winner()
 
-    white_player.handle_game_end(winner_color, winner_reason)
-    black_player.handle_game_end(winner_color, winner_reason)
+        white_player.handle_game_end(winner_color, winner_reason)
+        black_player.handle_game_end(winner_color, winner_reason)
 
-    output.write("Game Over!\n")
-    if winner_color is not None:
-        output.write(winner_reason)
-    else:
-        output.write('Draw!')
-    return winner_color, winner_reason
+        if record is not None:
+            record.write_result(winner_color, winner_reason)
+    finally:
+        if record is not None:
+            record.close()
+    return GameResult(player_names[0], player_names[1], winner_color, winner_reason, move_number - 1)
 
 
-def play_turn(game, player, turn, move_number, output, output_true):
+def play_turn(game, player, turn, move_number, output=None, output_true=None, headless=False, record=None):
     possible_moves = game.get_moves()
     possible_sense = list(chess.SQUARES)
 
@@ -90,13 +159,15 @@ def play_turn(game, player, turn, move_number, output, output_true):
     sense = player.choose_sense(possible_sense, possible_moves, game.get_seconds_left())
     sense_result = game.handle_sense(sense)
     player.handle_sense_result(sense_result)
-    print_sense(game, turn, sense)
+    if not headless:
+        print_sense(game, turn, sense)
 
-    output.write("##################################--Sense Around Square {}\n".format(chess.SQUARE_NAMES[sense]))
-    if turn:
-        format_write_board(output, game.white_board)
-    else:
-        format_write_board(output, game.black_board)
+    if output is not None:
+        output.write("##################################--Sense Around Square {}\n".format(chess.SQUARE_NAMES[sense]))
+        if turn:
+            format_write_board(output, game.white_board)
+        else:
+            format_write_board(output, game.black_board)
 
     # play move action
     move = player.choose_move(possible_moves, game.get_seconds_left())
@@ -104,15 +175,19 @@ def play_turn(game, player, turn, move_number, output, output_true):
     player.handle_move_result(requested_move, taken_move, reason, captured_square is not None,
                               captured_square)
 
-    output.write("##################################--Move requested: {} -- Move taken: {}\n".format(requested_move, taken_move))
-    output_true.write("##################################--Move requested: {} -- Move taken: {}\n\n".format(requested_move, taken_move))
-    if turn:
-        format_write_board(output, game.white_board)
-    else:
-        format_write_board(output, game.black_board)
+    if record is not None:
+        record.write_ply(sense, requested_move, taken_move, captured_square)
+
+    if output is not None:
+        output.write("##################################--Move requested: {} -- Move taken: {}\n".format(requested_move, taken_move))
+        output_true.write("##################################--Move requested: {} -- Move taken: {}\n\n".format(requested_move, taken_move))
+        if turn:
+            format_write_board(output, game.white_board)
+        else:
+            format_write_board(output, game.black_board)
 
-    output.write("##################################--Truth Board State\n")
-    format_write_board(output, game.truth_board)
+        output.write("##################################--Truth Board State\n")
+        format_write_board(output, game.truth_board)
 
     game.end_turn()
     return requested_move, taken_move
@@ -181,13 +256,7 @@ def format_write_board(out, board):
             fb += '| ' + f + ' '
     fb += '|'
 
-    ind = 0
-    for i in range(9):
-        for j in range(34):
-            out.write(fb[ind])
-            ind += 1
-        out.write('\n')
-    out.write('\n')
+    out.write("".join(fb[row * 34:(row + 1) * 34] + '\n' for row in range(9)) + '\n')
 
 
 if __name__ == '__main__':
@@ -196,6 +265,10 @@ if __name__ == '__main__':
     parser.add_argument('second_path', help='Path to second bot source file.')
     # parser.add_argument('--color', default='random', choices=['white', 'black', 'random'],
     #                    help='The color you want to play as.')
+    parser.add_argument('--headless', action='store_true',
+                        help='Play without printing boards or writing GameHistory files, only print the result.')
+    parser.add_argument('--text-history', action='store_true',
+                        help='Also write the board-by-board text dumps to GameHistory.')
     args = parser.parse_args()
 
     name_one, constructor_one = load_player(args.first_path)
@@ -212,10 +285,13 @@ if __name__ == '__main__':
             players.reverse()
             player_names.reverse()
 
-    win_color, win_reason = play_local_game(players[0], players[1], player_names)
-
-    print('Game Over!')
-    if win_color is not None:
-        print(win_reason)
+    if args.headless:
+        print(play_local_game(players[0], players[1], player_names, headless=True))
     else:
-        print('Draw!')
\ No newline at end of file
+        win_color, win_reason = play_local_game(players[0], players[1], player_names, text_history=args.text_history)
+
+        print('Game Over!')
+        if win_color is not None:
+            print(win_reason)
+        else:
+            print('Draw!')
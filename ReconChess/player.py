@@ -12,6 +12,7 @@ Source:         Adapted from recon-chess (https://pypi.org/project/reconchess/)
 import os
 import sys
 import importlib
+import importlib.util
 import inspect
 import chess
 
@@ -21,16 +22,21 @@ class Player(object):
         pass
 
 
-def load_player(source_path):
+def load_player(source_path, module_name=None):
     """
     This is function loads a subclass of the Player class that is contained in a python source file or python module.
     There must only be *1* such subclass in the file or module.
 
     :param source_path: the path to the source file to load
+    :param module_name: load the source file under this module name instead of its file name, so source files with the
+                        same name do not replace each other. The modules it imports from its own directory are dropped
+                        from sys.modules afterwards, so the next source file imports its own versions of them.
     :return: Tuple where the first element is the name of the loaded class, and the second element is the class type
     """
 
-    if os.path.exists(source_path):
+    if module_name is not None and os.path.exists(source_path):
+        module = _load_isolated_module(source_path, module_name)
+    elif os.path.exists(source_path):
         # get the path to the main source file
         abs_source_path = os.path.abspath(source_path)
 
@@ -40,14 +46,32 @@ def load_player(source_path):
 
         # import_module expects a module name, so remove the extension
         module_name = os.path.splitext(os.path.basename(abs_source_path))[0]
+        module = importlib.import_module(module_name)
     else:
-        module_name = source_path
+        module = importlib.import_module(source_path)
 
-    module = importlib.import_module(module_name)
     players = inspect.getmembers(module, lambda o: inspect.isclass(o) and issubclass(o, Player) and o != Player)
     if len(players) == 0:
         raise RuntimeError('{} did not contain any subclasses of {}'.format(source_path, Player))
     elif len(players) > 1:
         raise RuntimeError(
             '{} contained multiple subclasses of {}: {}. Should have exactly 1'.format(source_path, players, Player))
-    return players[0]
\ No newline at end of file
+    return players[0]
+
+
+def _load_isolated_module(source_path, module_name):
+    directory = os.path.dirname(os.path.abspath(source_path))
+    loaded = set(sys.modules)
+    sys.path.insert(0, directory)
+    try:
+        spec = importlib.util.spec_from_file_location(module_name, source_path)
+        module = importlib.util.module_from_spec(spec)
+        sys.modules[module_name] = module
+        spec.loader.exec_module(module)
+    finally:
+        sys.path.remove(directory)
+        for name in set(sys.modules) - loaded:
+            source = getattr(sys.modules[name], '__file__', None)
+            if name != module_name and source and os.path.dirname(os.path.abspath(source)) == directory:
+                del sys.modules[name]
+    return module
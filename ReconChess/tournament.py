@@ -0,0 +1,138 @@
+#!/usr/bin/env python3
+
+"""
+File Name:      tournament.py
+
+Description:    Python file used to play many headless games between agents across a process pool.
+"""
+
+import argparse
+import itertools
+import multiprocessing
+import os
+import random
+import chess
+from player import load_player
+from play_game import play_local_game
+
+
+# player constructors of the current worker process, loaded once by _load_players
+_players = dict()
+
+
+def round_robin(paths, games):
+    """
+    Every pair of agents plays `games` games with each color.
+
+    :param paths: List(str) -- agent source files
+    :param games: int -- games per pair and color
+    :return: generator of (white_path, black_path)
+    """
+    for first, second in itertools.combinations(paths, 2):
+        for _ in range(games):
+            yield first, second
+            yield second, first
+
+
+def gauntlet(paths, games):
+    """
+    The first agent plays `games` games with each color against every other agent.
+
+    :param paths: List(str) -- agent source files, the first one runs the gauntlet
+    :param games: int -- games per opponent and color
+    :return: generator of (white_path, black_path)
+    """
+    for opponent in paths[1:]:
+        for _ in range(games):
+            yield paths[0], opponent
+            yield opponent, paths[0]
+
+
+SCHEDULES = {'round-robin': round_robin, 'gauntlet': gauntlet}
+
+
+def _load_players(paths, seed):
+    for index, path in enumerate(paths):
+        if path not in _players:
+            # each agent gets a module name of its own, so agents with the same file name do not replace each other
+            _players[path] = load_player(path, "_tournament_agent_{}".format(index))
+
+    # forked workers share the parent's random state, so reseed each one
+    if seed is None:
+        random.seed()
+
+
+def _play_game(job):
+    index, white_path, black_path, seed, history = job
+    if seed is not None:
+        random.seed("{}-{}".format(seed, index))
+
+    white_name, white_constructor = _players[white_path]
+    black_name, black_constructor = _players[black_path]
+    record_path = os.path.join(history, "{}.rcr".format(index)) if history else None
+    result = play_local_game(white_constructor(), black_constructor(), [white_name, black_name], headless=True,
+                             record_path=record_path)
+    return white_path, black_path, result
+
+
+def run_tournament(paths, games=1, schedule='round-robin', workers=None, seed=None, history=None):
+    """
+    Plays a tournament across a process pool. Every worker loads the agents once and builds fresh players for each
+    game from the loaded classes.
+
+    :param paths: List(str) -- agent source files
+    :param games: int -- games per pairing and color
+    :param schedule: str -- 'round-robin' or 'gauntlet'
+    :param workers: int -- number of processes, defaults to the number of cores
+    :param seed: int -- makes every game's random choices reproducible, None for fresh randomness
+    :param history: str -- directory for a binary game record per game, None to skip them
+    :return: generator of (white_path, black_path, GameResult), in the order the games finish
+    """
+    paths = [path for index, path in enumerate(paths) if path not in paths[:index]]
+    jobs = [(index, white_path, black_path, seed, history)
+            for index, (white_path, black_path) in enumerate(SCHEDULES[schedule](paths, games))]
+    if history:
+        os.makedirs(history, exist_ok=True)
+
+    with multiprocessing.Pool(workers, initializer=_load_players, initargs=(paths, seed)) as pool:
+        for outcome in pool.imap_unordered(_play_game, jobs):
+            yield outcome
+
+
+def print_standings(standings):
+    print("{:<40} {:>6} {:>6} {:>6} {:>8}".format("Agent", "Wins", "Losses", "Draws", "Win %"))
+    for path, (wins, losses, draws) in sorted(standings.items(), key=lambda item: -item[1][0]):
+        played = wins + losses + draws
+        # agents without a game, such as a gauntlet of one, have no win rate
+        win_rate = "{:.1f}".format(100.0 * wins / played) if played else "-"
+        print("{:<40} {:>6} {:>6} {:>6} {:>8}".format(path, wins, losses, draws, win_rate))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Plays a headless tournament between bots on all cores.')
+    parser.add_argument('paths', nargs='+', help='Paths to the bot source files.')
+    parser.add_argument('--games', type=int, default=1, help='Games per pairing and color.')
+    parser.add_argument('--schedule', default='round-robin', choices=sorted(SCHEDULES),
+                        help='round-robin plays every pair, gauntlet plays the first bot against all others.')
+    parser.add_argument('--workers', type=int, default=None, help='Number of processes, defaults to all cores.')
+    parser.add_argument('--seed', type=int, default=None, help='Seed for reproducible games.')
+    parser.add_argument('--history', default=None, help='Directory to write a binary game record for every game.')
+    args = parser.parse_args()
+
+    standings = {path: [0, 0, 0] for path in args.paths}
+    for number, (white_path, black_path, result) in enumerate(
+            run_tournament(args.paths, args.games, args.schedule, args.workers, args.seed, args.history), 1):
+        if result.winner_color is None:
+            standings[white_path][2] += 1
+            standings[black_path][2] += 1
+        elif result.winner_color == chess.WHITE:
+            standings[white_path][0] += 1
+            standings[black_path][1] += 1
+        else:
+            standings[black_path][0] += 1
+            standings[white_path][1] += 1
+
+        print("[{}] {} (WHITE) vs {} (BLACK) -- {} in {} turns".format(
+            number, white_path, black_path, result.winner_reason or 'Draw!', result.turns))
+
+    print_standings(standings)